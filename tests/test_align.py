@@ -0,0 +1,43 @@
+from tmdm.align import Aligner, normalise, align_batch
+from tmdm.util import get_offsets
+
+
+def test_normalise_folds_case_accents_and_drops_non_printables():
+    assert normalise("Café​Straße") == "cafestrasse"
+    assert normalise("a\tb") == "a\tb"
+
+
+def test_aligner_maps_back_to_original_offsets():
+    text = "Der Kaffee im Café­ Straße ist gut."
+    aligner = Aligner(text)
+    start, end = aligner.find("cafe")
+    assert text[start:end] == "Café"
+    start, end = aligner.find("STRASSE", end)
+    assert text[start:end] == "Straße"
+    assert aligner.find("Kaffee", end) is None
+
+
+def test_aligner_reports_unaligned_tokens():
+    text = "I like cakes."
+    alignment = Aligner(text).align(zip("I like big cakes .".split(), "O O B-CAKE I-CAKE O".split()))
+    assert alignment.entities == [(7, 12, "CAKE")]
+    assert alignment.unaligned == [2]
+    assert alignment.end == 13
+
+
+def test_get_offsets_works_with_unicode():
+    text = "Ich mag ﬁnanzierte KUCHEN​."
+    annotation = list(zip("ich mag finanzierte kuchen .".split(), "O B-CAKE I-CAKE I-CAKE O".split()))
+    assert get_offsets(text, annotation) == [(4, 25, "CAKE")]
+
+
+def test_align_batch_with_sentences():
+    texts = ["I like cakes. Cheese cake too.", "Trains."]
+    annotations = [
+        [list(zip("I like cakes .".split(), "O O B-CAKE O".split())),
+         list(zip("Cheese cake too .".split(), "B-CAKE I-CAKE O O".split()))],
+        [list(zip("Trains .".split(), "B-TRAIN O".split()))],
+    ]
+    expected = [[(7, 12, "CAKE"), (14, 25, "CAKE")], [(0, 6, "TRAIN")]]
+    assert align_batch(texts, annotations, sentences=True) == expected
+    assert align_batch(texts, annotations, sentences=True, n_process=2, chunk_size=1) == expected
@@ -0,0 +1,77 @@
+import pytest
+
+from tmdm.cached import CachingProvider, Cached
+from tmdm.main import tmdm_pipeline
+from tmdm.stores import SqliteStore
+from tests import testutil
+
+testdata = [
+    {"id": "doc1", "text": "The cake is a lie."},
+    {"id": "doc2", "text": "I like trains."}
+]
+
+
+def test_caching_provider_only_annotates_misses(tmp_path):
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    path = str(tmp_path / "store.sqlite")
+    inner = testutil.CountingProvider("The", "X")
+    provider = CachingProvider(inner, path)
+    docs = list(nlp.pipe(testdata[:1]))
+    assert provider.annotate_batch(docs) == [[[0, 3, "X"]]]
+    docs = list(nlp.pipe(testdata))
+    assert provider.annotate_batch(docs) == [[[0, 3, "X"]], []]
+    assert inner.annotated == [d['text'] for d in testdata]
+
+    inner = testutil.CountingProvider("The", "X")
+    provider = CachingProvider(inner, path)
+    assert provider.annotate_batch(docs) == [[[0, 3, "X"]], []]
+    assert inner.annotated == []
+
+
+def test_caching_provider_by_text(tmp_path):
+    nlp = tmdm_pipeline()
+    inner = testutil.CountingProvider("The", "X")
+    provider = CachingProvider(inner, SqliteStore(str(tmp_path / "store.sqlite")), key='text')
+    provider.annotate_batch([nlp("The cake is a lie.")])
+    provider.annotate_batch([nlp("The cake is a lie.")])
+    assert len(inner.annotated) == 1
+
+
+def test_cached_convert_replays_offsets(tmp_path):
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    provider = Cached(schema='tuple_of_lists_flat')
+    provider.cache = {
+        "doc1": ("The cake is a lie .".split(), "O B-CAKE O O B-LIE O".split()),
+        "doc2": ("I like trains .".split(), "O O B-TRAIN O".split()),
+    }
+    provider.loaded = True
+    docs = list(nlp.pipe(testdata))
+    converted = provider.convert(docs, str(tmp_path / "converted.mpkx"))
+    assert converted.known_schemas["checked_offsets"] == converted.schema
+    assert [converted.annotate_document(doc) for doc in docs] == [
+        [[4, 8, "CAKE"], [14, 17, "LIE"]], [[7, 13, "TRAIN"]]
+    ]
+
+    changed = nlp({"id": "doc2", "text": "I like planes."})
+    assert converted.annotate_document(changed) is None
+
+
+def test_cached_convert_rejects_read_only_formats(tmp_path):
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    provider = Cached()
+    provider.cache = {"doc1": [[4, 8, "CAKE"]]}
+    provider.loaded = True
+    docs = (nlp(d) for d in testdata)
+    with pytest.raises(ValueError):
+        provider.convert(docs, str(tmp_path / "converted.jsonl"))
+    # the docs are left alone
+    assert len(list(docs)) == 2
+    assert provider.convert(nlp.pipe(testdata[1:]), str(tmp_path / "empty.mpkx")).cache.get("doc2") is None
+
+
+def test_cached_aligns_sentences_of_lists():
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    provider = Cached(schema='tuple_of_lists_of_lists')
+    provider.cache = {"doc1": ([["The", "cake"], ["is", "a", "lie", "."]], [["O", "B-CAKE"], ["O", "O", "B-LIE", "O"]])}
+    provider.loaded = True
+    assert provider.annotate_document(nlp(testdata[0])) == [(4, 8, "CAKE"), (14, 17, "LIE")]
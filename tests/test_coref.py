@@ -32,3 +32,24 @@ def test_not_coreferent_from_different_docs():
     doc1._.corefs = annotations
     doc2._.corefs = annotations
     assert not doc1._.corefs[0]._.same(doc2._.corefs[0])
+
+
+def test_clusters_with_sparse_ids():
+    txt = "Cheesecake is great. It tastes so good! I like red velvet cake too."
+    doc = nlp(txt)
+    doc._.id = "sparse-clusters"
+    doc._.corefs = [(0, 10, "CLUSTER-7"), (txt.index("I "), txt.index("I ") + 1, "CLUSTER-42"),
+                    (txt.index("It"), txt.index("It") + 2, "CLUSTER-7")]
+    corefs = doc._.corefs
+    assert [c.cluster_id for c in corefs] == [7, 42, 7]
+    assert [c.start_char for c in corefs[2].cluster] == [0, txt.index("It")]
+    assert [c.start_char for c in corefs[1].cluster] == [txt.index("I ")]
+
+
+def test_coref_views():
+    txt = "Cheesecake is great. It tastes so good!"
+    doc = nlp(txt)
+    doc._.corefs = [(0, 10, "CLUSTER-3"), (txt.index("It"), txt.index("It") + 2, "CLUSTER-3")]
+    views = doc._.coref_views
+    assert [(v.text, v.cluster_id) for v in views] == [("Cheesecake", 3), ("It", 3)]
+    assert views[1].span().cluster_id == 3
@@ -0,0 +1,56 @@
+from tmdm.classes import ERTuple
+from tmdm.dedup import DeduplicatingProvider, project_annotations, MinHasher
+from tmdm.main import tmdm_pipeline
+from tests import testutil
+
+abstract = ("Cheesecake is a sweet dessert consisting of one or more layers. The main, and thickest, layer consists of "
+            "a mixture of a soft, fresh cheese, eggs, and sugar.")
+near_duplicate = abstract.replace(", and thickest,", "")
+extended = abstract + " Some use cheese."
+other = "I chew bubble gum and kick butts. And I am all out of gum."
+
+
+def test_project_annotations():
+    annotations = [(abstract.index("sweet"), abstract.index("sweet") + 5, "TASTE")]
+    (start, end, label), = project_annotations(annotations, abstract, near_duplicate)
+    assert near_duplicate[start:end] == "sweet" and label == "TASTE"
+    oies = ERTuple([(0, 10, "ARG-0"), (11, 13, "VERB")], [(1, 0, "ARG-0")])
+    projected = project_annotations(oies, abstract, near_duplicate)
+    assert near_duplicate[slice(*projected.entities[1][:2])] == "is"
+    assert projected.relations == oies.relations
+    # the annotated span itself changed
+    assert project_annotations([(abstract.index("main"), abstract.index("layer consists"), "X")], abstract,
+                               near_duplicate) is None
+    # the target has text of its own, which might be annotated
+    assert project_annotations(annotations, abstract, extended) is None
+
+
+def test_minhash_similarity():
+    hasher = MinHasher()
+    assert hasher.similarity(hasher.signature(abstract), hasher.signature(abstract)) == 1
+    assert hasher.similarity(hasher.signature(abstract), hasher.signature(near_duplicate)) > 0.8
+    assert hasher.similarity(hasher.signature(abstract), hasher.signature(other)) < 0.2
+
+
+def test_deduplicating_provider_annotates_representatives_only():
+    nlp = tmdm_pipeline()
+    inner = testutil.CountingProvider()
+    provider = DeduplicatingProvider(inner, threshold=0.8)
+    docs = list(nlp.pipe([abstract, other, abstract, near_duplicate]))
+    results = provider.annotate_batch(docs)
+    assert inner.annotated == [abstract, other]
+    for doc, annotations in zip(docs, results):
+        assert [doc.text[s:e] for s, e, _ in annotations] == ["cheese"] * doc.text.count("cheese")
+    # remembered across batches
+    provider.annotate_batch(list(nlp.pipe([near_duplicate])))
+    assert inner.annotated == [abstract, other]
+
+
+def test_deduplicating_provider_annotates_extended_near_duplicates():
+    nlp = tmdm_pipeline()
+    inner = testutil.CountingProvider()
+    provider = DeduplicatingProvider(inner)
+    docs = list(nlp.pipe([abstract, extended]))
+    results = provider.annotate_batch(docs)
+    assert inner.annotated == [abstract, extended]
+    assert [extended[s:e] for s, e, _ in results[1]] == ["cheese", "cheese"]
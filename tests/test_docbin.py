@@ -0,0 +1,49 @@
+from tmdm.classes import ERTuple
+from tmdm.main import tmdm_pipeline
+from tmdm.pipe.pipe import PipeElement
+from tmdm.writers.docbin import read_docbin, read_docbin_ids, get_docbin_writer_pipe, DocBinWriter
+
+txt = "I like cakes. They taste nice."
+testdata = [{"id": f"doc{i}", "text": txt} for i in range(5)]
+nes = [(txt.index('cakes'), txt.index('cakes') + len('cakes'), "FOOD")]
+corefs = [(txt.index('cakes'), txt.index('cakes') + len('cakes'), "CLUSTER-0"),
+          (txt.index('They'), txt.index('They') + len("They"), "CLUSTER-0")]
+oies = ERTuple([(txt.index('I'), txt.index('I') + len('I'), "ARG-0"),
+                (txt.index('like'), txt.index('like') + len("like"), "VERB"),
+                (txt.index('cakes'), txt.index('cakes') + len('cakes'), "ARG-1")],
+               [(1, 0, "ARG-0"), (1, 2, "ARG-1")])
+
+
+def test_docbin_roundtrip(tmp_path):
+    path = str(tmp_path / "docs.tmdm")
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    nlp.add_pipe(PipeElement('nes', 'nes', lambda docs: [nes for _ in docs]))
+    nlp.add_pipe(PipeElement('corefs', 'corefs', lambda docs: [corefs for _ in docs]))
+    nlp.add_pipe(PipeElement('oies', 'oies', lambda docs: [oies for _ in docs]))
+    nlp.add_pipe(get_docbin_writer_pipe(path, chunk_size=2))
+    assert len(list(nlp.pipe(testdata))) == 5
+
+    # a crash while writing leaves a truncated chunk behind
+    with open(path, 'ab') as f:
+        f.write(b'\x10\x00\x00')
+
+    docs = list(read_docbin(path, nlp.nlp))
+    assert [doc._.id for doc in docs] == [d['id'] for d in testdata]
+    for doc in docs:
+        assert doc.text == txt
+        assert doc._.nes[0].text == "cakes"
+        assert doc._.corefs[0].coreferent(doc._.corefs[1])
+        assert [a.text for a in doc._.oies[0].arguments] == ["I", "cakes"]
+        assert len(list(doc.sents)) == 2
+
+
+def test_docbin_ids_without_docs(tmp_path):
+    path = str(tmp_path / "docs.tmdm")
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    DocBinWriter(path)(list(nlp.pipe(testdata)))
+
+    # ids are read from the chunk header, the docs themselves are skipped
+    with open(path, 'r+b') as f:
+        f.seek(-16, 2)
+        f.write(b'\xff' * 16)
+    assert list(read_docbin_ids(path)) == [d['id'] for d in testdata]
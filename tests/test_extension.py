@@ -1,5 +1,11 @@
+import pytest
 import spacy
 from dynaconf import settings
+from spacy.tokens import Token, Doc, DocBin
+
+import tmdm.model.ne  # noqa: F401
+from tmdm.model.extensions import Annotation, AnnotationCache, memo_table, IntervalIndex, Adjacency, token_ranges, \
+    token_membership, token_annotations
 
 
 def test_same_for_equals():
@@ -13,3 +19,162 @@ def test_not_same_for_different_docs():
     doc_1 = nlp("Cheesecake is great.")
     doc_2 = nlp("Cheesecake is great.")
     assert not doc_1[0:2]._.same(doc_2[0:2])
+
+
+def test_annotation_cache_evicts_least_recently_used_doc():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    cache = AnnotationCache(max_docs=2)
+    docs = [nlp(f"Cheesecake number {i} is great.") for i in range(3)]
+    for i, doc in enumerate(docs):
+        doc._.id = f"doc{i}"
+    cache.put(Annotation, docs[0], 0, docs[0][0:1])
+    cache.put(Annotation, docs[1], 0, docs[1][0:1])
+    assert cache.get(Annotation, docs[0], 0) is not None
+    cache.put(Annotation, docs[2], 0, docs[2][0:1])
+    assert len(cache) == 2
+    assert cache.get(Annotation, docs[0], 0) is not None
+    assert cache.get(Annotation, docs[1], 0) is None
+
+
+def test_annotation_cache_release():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("Cheesecake is great.")
+    doc._.id = "release"
+    span = Annotation.make(doc, 0, 0, len("Cheesecake"), "CAKE")
+    assert Annotation.make(doc, 0, 0, len("Cheesecake"), "CAKE") is span
+    Annotation.cache.release(doc)
+    assert Annotation.make(doc, 0, 0, len("Cheesecake"), "CAKE") is not span
+
+
+def test_annotation_cache_does_not_mix_docs_with_same_id():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc_1 = nlp("Cheesecake is great.")
+    doc_2 = nlp("Cheesecake is great.")
+    doc_1._.id = doc_2._.id = "same"
+    assert Annotation.make(doc_2, 0, 0, len("Cheesecake"), "CAKE").doc is doc_2
+    assert Annotation.make(doc_1, 0, 0, len("Cheesecake"), "CAKE").doc is doc_1
+
+
+def test_char_span_relaxed_is_memoised_on_the_doc():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("Cheesecake is great.")
+    span = doc._.char_span_relaxed(0, 12)
+    assert span.text == "Cheesecake is"
+    assert memo_table(doc, 'char_span_relaxed') == {(0, 12): (0, 2)}
+    assert doc._.char_span_relaxed(0, 12)._.same(span)
+    assert memo_table(nlp("Cheesecake is great."), 'char_span_relaxed') == {}
+
+
+def test_token_ranges_agree_with_char_span_relaxed():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("Cheesecake  is great. It tastes so good!")
+    annotations = [(start, end, "X") for start in range(len(doc.text)) for end in range(start + 1, len(doc.text) + 1)]
+    first, last = token_ranges(doc, annotations)
+    for (start, end, _), f, l in zip(annotations, first, last):
+        span = doc._.char_span_relaxed(start, end)
+        assert (span.start, span.end) == (f, l), (start, end)
+
+
+def test_token_membership():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("Cheesecake is great.")
+    membership = token_membership(doc, 'nes', [(0, 13, "A"), (11, 19, "B"), (14, 19, "C")])
+    assert [membership[i] for i in range(len(doc))] == [[0], [0, 1], [1, 2], []]
+    assert token_membership(doc, 'corefs', [])[0] == []
+
+
+def test_token_annotations_are_per_doc():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    assert not Token.has_extension('_nes')
+    first, second = nlp("Cheesecake is great."), nlp("Cheesecake is great.")
+    first._.nes = [(0, 10, "CAKE")]
+    assert [ne.label_ for ne in first[0]._.nes] == ["CAKE"]
+    assert second[0]._.nes == []
+    assert token_annotations(first).get('nes').indices.dtype.itemsize == 4
+
+
+def test_token_annotations_roundtrip():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("Cheesecake is great. It tastes so good!")
+    doc._.nes = [(0, 10, "CAKE")]
+    assert [ne.label_ for ne in doc[0]._.nes] == ["CAKE"]
+    restored = Doc(nlp.vocab).from_bytes(doc.to_bytes())
+    assert [ne.label_ for ne in restored[0]._.nes] == ["CAKE"]
+    doc_bin = DocBin(store_user_data=True, docs=[doc])
+    restored, = DocBin().from_bytes(doc_bin.to_bytes()).get_docs(nlp.vocab)
+    assert [ne.label_ for ne in restored[0]._.nes] == ["CAKE"]
+    assert restored[1]._.nes == []
+
+
+def test_memoised_docs_roundtrip():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("Cheesecake is great. It tastes so good!")
+    span = doc._.char_span_relaxed(0, 12)
+    doc._.get_sent(1)
+    doc._.token_map
+    restored = Doc(nlp.vocab).from_bytes(doc.to_bytes())
+    assert restored._.char_span_relaxed(0, 12).text == span.text
+    assert memo_table(restored, 'char_span_relaxed') == {(0, 12): (0, 2)}
+    doc_bin = DocBin(store_user_data=True, docs=[doc])
+    restored, = DocBin().from_bytes(doc_bin.to_bytes()).get_docs(nlp.vocab)
+    assert restored._.get_sent(1).text == doc._.get_sent(1).text
+
+
+def test_token_map_and_char_to_token_agree():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("I like  cakes. They taste nice.")
+    expected = [i for i, token in enumerate(doc) for _ in range(len(token) + len(token.whitespace_))]
+    assert list(doc._.token_map) == expected
+    assert [doc._.char_to_token(c) for c in range(len(doc.text))] == expected
+
+
+def test_interval_index_queries():
+    index = IntervalIndex([(10, 15, "A"), (0, 4, "B"), (0, 20, "C"), (5, 9, "D"), (10, 15, "E")])
+    assert index.exact_matches(10, 15) == [0, 4]
+    assert index.exact_matches(10, 14) == []
+    assert index.contained_in(0, 15) == [0, 1, 3, 4]
+    assert index.contained_in(5, 9) == [3]
+    assert index.contained_in(16, 30) == []
+    assert IntervalIndex([]).contained_in(0, 10) == []
+
+
+def test_adjacency_slices():
+    # edges as (verb, argument) relations, with 1 and 4 as verbs
+    sources, targets = [4, 1, 1, 4], [5, 3, 2, 0]
+    adjacency = Adjacency(sources, targets, 6, sort_targets=True)
+    assert len(adjacency) == 6
+    assert adjacency[1] == [2, 3]
+    assert adjacency[4] == [0, 5]
+    assert adjacency[0] == adjacency[5] == []
+    assert Adjacency(targets, sources, 6)[3] == [1]
+    assert Adjacency([], [], 2)[1] == []
+
+
+def test_sentence_lookups():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("I like cakes. They taste nice. Cheesecake is great.")
+    sents = list(doc.sents)
+    assert len(sents) == 3
+    for i, sent in enumerate(sents):
+        assert doc._.get_sent_nr(sent) == i
+        assert doc._.get_sent(i)._.same(sent)
+    assert doc._.to_relative(5, 7) == (1, (1, 3))
+    assert doc._.to_absolute(1, 1, 3) == (5, 7)
+    with pytest.raises(ValueError):
+        doc._.get_sent_nr(doc[1:3])
+
+
+def test_ne_views_create_spans_on_demand():
+    nlp = spacy.load("en_core_web_sm", disable='ner')
+    doc = nlp("Cheesecake is great.")
+    doc._.id = "views"
+    doc._.nes = [(0, 10, "CAKE"), (14, 19, {"label": "QUALITY", "uri": "http://example.org/great"})]
+    views = doc._.ne_views
+    assert [(v.start_char, v.end_char, v.label_, v.text) for v in views] == [
+        (0, 10, "CAKE", "Cheesecake"), (14, 19, "QUALITY", "great")
+    ]
+    assert views[0].meta == {} and views[1].meta["uri"] == "http://example.org/great"
+    assert not hasattr(views[0], '__dict__')
+    span = views[1].span()
+    assert span.text == "great" and span._.ne_meta["uri"] == "http://example.org/great"
+    assert span is doc._.nes[1]
@@ -0,0 +1,170 @@
+from uuid import UUID, uuid5, NAMESPACE_URL
+
+import pytest
+
+from tmdm.main import tmdm_pipeline
+from tmdm.pipe.pipe import PipeElement
+from tmdm.pipe.checkpoint import Checkpoint
+from tmdm.pipe.sharded import ShardedPipeline
+from tmdm.writers.docbin import read_docbin
+
+testdata = [
+    {"id": "doc1", "text": "The cake is a lie. I like trains."},
+    {"id": "doc2", "text": "I chew bubble gum and kick butts."},
+    {"id": "doc3", "text": "Cheesecake is great. It tastes so good!"}
+]
+
+
+def test_pipe_keeps_ids_and_order():
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    docs = list(nlp.pipe(testdata, batch_size=2))
+    assert [doc._.id for doc in docs] == ["doc1", "doc2", "doc3"]
+    assert [doc.text for doc in docs] == [d['text'] for d in testdata]
+
+
+def test_pipe_runs_pipes_on_batches():
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    seen = []
+    nlp.add_pipe(PipeElement(name='counter', field=None, provider=lambda docs: seen.append(len(docs))))
+    docs = list(nlp.pipe(testdata, batch_size=2, nlp_batch_size=1))
+    assert len(docs) == 3
+    assert seen == [2, 1]
+
+
+def _id_pipeline():
+    return tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+
+
+def test_sharded_pipeline_keeps_order():
+    nlp = ShardedPipeline(_id_pipeline, n_workers=2, chunk_size=1)
+    docs = list(nlp.pipe(testdata))
+    assert [doc._.id for doc in docs] == ["doc1", "doc2", "doc3"]
+    assert [doc.text for doc in docs] == [d['text'] for d in testdata]
+
+
+def test_sharded_pipeline_keeps_uuid_ids():
+    nlp = ShardedPipeline(tmdm_pipeline, n_workers=1, chunk_size=2)
+    docs = list(nlp.pipe([d['text'] for d in testdata]))
+    assert all(isinstance(doc._.id, UUID) for doc in docs)
+    assert len({doc._.id for doc in docs}) == 3
+
+
+def _failing_pipeline():
+    raise OSError("Can't find model")
+
+
+def test_sharded_pipeline_raises_factory_errors():
+    nlp = ShardedPipeline(_failing_pipeline, n_workers=1, chunk_size=1)
+    with pytest.raises(OSError):
+        list(nlp.pipe(testdata))
+
+
+def _ne_pipeline():
+    nlp = _id_pipeline()
+    nlp.add_pipe(PipeElement(name='nes', field='nes', provider=lambda docs: [[(4, 8, "CAKE")] for _ in docs]))
+    return nlp
+
+
+def test_sharded_pipeline_keeps_annotations():
+    nlp = ShardedPipeline(_ne_pipeline, n_workers=2, chunk_size=2)
+    docs = list(nlp.pipe(testdata))
+    assert [doc._._nes for doc in docs] == [[[4, 8, "CAKE"]]] * 3
+    assert docs[0]._.nes[0].text == "cake"
+
+
+def test_overlapping_pipe_keeps_order_and_annotates():
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    seen = []
+    nlp.add_pipe(PipeElement(name='first', field=None, provider=lambda docs: seen.extend(d._.id for d in docs)))
+    nlp.add_pipe(PipeElement(name='second', field=None, provider=lambda docs: seen.extend(d._.id for d in docs)))
+    docs = list(nlp.pipe(testdata, batch_size=1, overlap=True))
+    assert [doc._.id for doc in docs] == ["doc1", "doc2", "doc3"]
+    assert sorted(seen) == sorted(["doc1", "doc2", "doc3"] * 2)
+
+
+def test_overlapping_pipe_raises_stage_errors():
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+
+    def fail(docs):
+        raise KeyError("boom")
+
+    nlp.add_pipe(PipeElement(name='failing', field=None, provider=fail))
+    with pytest.raises(KeyError):
+        list(nlp.pipe(testdata, overlap=True))
+
+
+@pytest.mark.parametrize("overlap", [False, True])
+def test_pipes_get_their_own_batch_sizes(overlap):
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    small, large, by_tokens = [], [], []
+    nlp.add_pipe(PipeElement(name='small', field=None, provider=lambda docs: small.append(len(docs)), batch_size=1))
+    nlp.add_pipe(PipeElement(name='large', field=None, provider=lambda docs: large.append(len(docs)), batch_size=100))
+    nlp.add_pipe(PipeElement(name='tokens', field=None, provider=lambda docs: by_tokens.append(len(docs)),
+                             max_tokens=20))
+    docs = list(nlp.pipe(testdata, batch_size=2, overlap=overlap))
+    assert [doc._.id for doc in docs] == ["doc1", "doc2", "doc3"]
+    assert small == [1, 1, 1]
+    assert large == [3]
+    # 11 + 9 tokens fit into the budget, the last doc does not
+    assert by_tokens == [2, 1]
+
+
+def test_content_ids_are_stable():
+    nlp = tmdm_pipeline(content_ids=True)
+    texts = [d['text'] for d in testdata] + [testdata[0]['text']]
+    ids = [doc._.id for doc in nlp.pipe(texts)]
+    assert ids[0] == ids[3]
+    assert len(set(ids)) == 3
+    assert ids == [doc._.id for doc in tmdm_pipeline(content_ids=True).pipe(texts)]
+    assert nlp(texts[0])._.id == ids[0]
+    assert tmdm_pipeline()(texts[0])._.id != tmdm_pipeline()(texts[0])._.id
+
+
+def test_checkpointed_pipe_resumes(tmp_path):
+    path = str(tmp_path / "checkpoint.tmdm")
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    seen = []
+
+    def crash_on_doc3(docs):
+        if any(d._.id == "doc3" for d in docs) and "doc3" not in seen:
+            seen.append("doc3")
+            raise KeyboardInterrupt()
+        seen.extend(d._.id for d in docs)
+
+    nlp.add_pipe(PipeElement(name='crasher', field=None, provider=crash_on_doc3))
+    with pytest.raises(KeyboardInterrupt):
+        list(nlp.pipe(testdata, batch_size=1, checkpoint=Checkpoint(path, every=1)))
+    assert seen == ["doc1", "doc2", "doc3"]
+
+    docs = list(nlp.pipe(testdata, batch_size=1, checkpoint=Checkpoint(path, every=1)))
+    assert [doc._.id for doc in docs] == ["doc3"]
+    assert seen == ["doc1", "doc2", "doc3", "doc3"]
+    assert [doc._.id for doc in read_docbin(path, nlp.nlp)] == ["doc1", "doc2", "doc3"]
+
+    with pytest.raises(ValueError):
+        list(tmdm_pipeline().pipe(["text"], checkpoint=Checkpoint(path)))
+
+
+def test_checkpoint_resumes_after_partial_chunk(tmp_path):
+    path = str(tmp_path / "checkpoint.tmdm")
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    assert len(list(nlp.pipe(testdata[:2], batch_size=1, checkpoint=Checkpoint(path, every=1)))) == 2
+
+    # a crash while writing leaves a partial chunk behind
+    with open(path, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x00\x00\x00\x00\x01\x02')
+
+    docs = list(nlp.pipe(testdata, batch_size=1, checkpoint=Checkpoint(path, every=1)))
+    assert [doc._.id for doc in docs] == ["doc3"]
+    assert [doc._.id for doc in read_docbin(path, nlp.nlp)] == ["doc1", "doc2", "doc3"]
+    assert list(nlp.pipe(testdata, batch_size=1, checkpoint=Checkpoint(path, every=1))) == []
+
+
+def test_checkpoint_resumes_with_uuid_ids(tmp_path):
+    path = str(tmp_path / "checkpoint.tmdm")
+    nlp = tmdm_pipeline(getter=lambda d: (uuid5(NAMESPACE_URL, d['id']), d['text']), with_ids=True)
+    assert len(list(nlp.pipe(testdata[:2], batch_size=1, checkpoint=Checkpoint(path, every=1)))) == 2
+
+    docs = list(nlp.pipe(testdata, batch_size=1, checkpoint=Checkpoint(path, every=1)))
+    assert [doc._.id for doc in docs] == [uuid5(NAMESPACE_URL, "doc3")]
+    assert [doc._.id for doc in read_docbin(path, nlp.nlp)] == [uuid5(NAMESPACE_URL, d['id']) for d in testdata]
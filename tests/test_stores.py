@@ -0,0 +1,89 @@
+import os
+import pickle
+
+import ujson as json
+
+from tmdm.cached import Cached
+from tmdm.main import tmdm_pipeline
+from tmdm.stores import MsgpackStore, JsonlStore, SqliteStore
+
+annotations = {
+    "doc1": [[4, 8, "CAKE"]],
+    "doc2": [[0, 6, "GUM"], [10, 14, "GUM"]],
+    "a-much-longer-document-id": [],
+}
+
+
+def test_msgpack_store_roundtrip(tmp_path):
+    path = str(tmp_path / "cache.mpkx")
+    store = MsgpackStore.write(path, annotations.items())
+    assert len(store) == 3
+    assert set(store) == set(annotations)
+    for key, value in annotations.items():
+        assert key in store
+        assert store[key] == value
+    assert store.get("doc3") is None
+    assert "doc" not in store
+    assert pickle.loads(pickle.dumps(store))["doc2"] == annotations["doc2"]
+
+
+def test_msgpack_store_keeps_last_duplicate(tmp_path):
+    path = str(tmp_path / "cache.mpkx")
+    store = MsgpackStore.write(path, [("doc1", [1]), ("doc2", [2]), ("doc1", [3])])
+    assert len(store) == 2
+    assert store["doc1"] == [3]
+
+
+def test_empty_stores(tmp_path):
+    store = MsgpackStore.write(str(tmp_path / "cache.mpkx"), [])
+    assert len(store) == 0
+    assert "doc1" not in store
+    path = tmp_path / "cache.jsonl"
+    path.write_text("")
+    store = JsonlStore(str(path))
+    assert len(store) == 0 and list(store) == []
+
+
+def test_cached_reads_from_store(tmp_path):
+    path = str(tmp_path / "cache.mpkx")
+    provider = Cached()
+    provider.cache = annotations
+    provider.save(path)
+    provider = Cached(path=path)
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    doc = nlp({"id": "doc1", "text": "The cake is a lie."})
+    assert provider.annotate_document(doc) == [[4, 8, "CAKE"]]
+
+
+def test_jsonl_store_indexes_and_reads_lazily(tmp_path):
+    path = tmp_path / "cache.jsonl"
+    lines = [{"id": key, "annotations": value} for key, value in annotations.items()]
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n\n")
+    store = JsonlStore(str(path))
+    assert os.path.exists(str(path) + ".idx.npy")
+    assert len(store) == 3
+    for line in lines:
+        assert store[line["id"]] == line
+    assert "doc3" not in store
+
+
+def test_cached_reads_jsonl(tmp_path):
+    path = tmp_path / "cache.jsonl"
+    path.write_text(json.dumps({"doc_id": "doc1", "annotations": [[4, 8, "CAKE"]]}) + "\n")
+    provider = Cached(path=str(path), getter=lambda d: d["annotations"], id_field="doc_id")
+    nlp = tmdm_pipeline(getter=lambda d: (d['id'], d['text']), with_ids=True)
+    doc = nlp({"id": "doc1", "text": "The cake is a lie."})
+    assert provider.annotate_document(doc) == [[4, 8, "CAKE"]]
+
+
+def test_sqlite_store_roundtrip(tmp_path):
+    store = SqliteStore(str(tmp_path / "store.sqlite"))
+    store.update({"a": [[0, 1, "X"]], "b": {"label": "Y"}})
+    store["c"] = []
+    assert len(store) == 3
+    assert store["a"] == [[0, 1, "X"]]
+    assert "b" in store and "d" not in store
+    del store["c"]
+    assert sorted(store) == ["a", "b"]
+    store.close()
+    assert SqliteStore(str(tmp_path / "store.sqlite"))["b"] == {"label": "Y"}
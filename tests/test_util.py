@@ -3,7 +3,8 @@ import string
 from loguru import logger
 
 from tests import testutil
-from tmdm.util import merge_two_annotations, bio_generator, get_offsets, get_offsets_from_sentences, get_offsets_from_brat
+from tmdm.util import merge_two_annotations, bio_generator, get_offsets, get_offsets_from_sentences, get_offsets_from_brat, \
+    batch_by_budget, predict_bucketed
 import pytest
 import os
 
@@ -185,3 +186,25 @@ def test_get_brat_offsets_on_realistic_input():
     for idx, s in enumerate(offsets):
         token = norm_txt[s[0]:s[1]]
         assert "".join(token) == label[idx]
+
+
+def test_batch_by_budget_respects_items_and_tokens():
+    items = ["a", "bb", "ccc", "dddd"]
+    assert list(batch_by_budget(items, max_items=3)) == [["a", "bb", "ccc"], ["dddd"]]
+    assert list(batch_by_budget(items, max_tokens=3)) == [["a", "bb"], ["ccc"], ["dddd"]]
+    assert list(batch_by_budget(items, max_items=1, max_tokens=100)) == [[i] for i in items]
+    with pytest.raises(ValueError):
+        list(batch_by_budget(items))
+
+
+def test_predict_bucketed_scatters_results_back():
+    items = ["a b c d", "a", "a b c d e f", "a b"]
+    batches = []
+
+    def predict(batch):
+        batches.append(batch)
+        return [item.upper() for item in batch]
+
+    result = predict_bucketed(items, predict, max_tokens=6, length=lambda s: len(s.split()))
+    assert result == [item.upper() for item in items]
+    assert batches == [["a", "a b"], ["a b c d"], ["a b c d e f"]]
@@ -1,5 +1,9 @@
+import re
+
 import ujson as json
 
+from tmdm.cached import Cached
+
 def get_test_docs():
     with open('tests/resources/docs.json', encoding='utf-8') as f:
         return json.load(f)
@@ -18,3 +22,21 @@ def get_test_brat():
         brat_ann = f.read()
         
     return [brat_txt, brat_ann]
+
+
+class CountingProvider(Cached):
+    """
+    Annotates every occurrence of a word and records the texts of the docs it is asked to annotate.
+    """
+    name = 'counting'
+
+    def __init__(self, word: str = "cheese", label: str = "FOOD"):
+        super().__init__()
+        self.word = word
+        self.label = label
+        self.annotated = []
+
+    def annotate_batch(self, docs):
+        self.annotated.extend(doc.text for doc in docs)
+        return [[(m.start(), m.end(), self.label) for m in re.finditer(re.escape(self.word), doc.text)]
+                for doc in docs]
@@ -0,0 +1,197 @@
+import multiprocessing
+import re
+import unicodedata
+from itertools import accumulate, repeat
+from typing import Iterable, Tuple, List, NamedTuple, Optional, Sequence
+
+from loguru import logger
+
+# ASCII control characters other than whitespace, which are dropped by normalisation
+_ASCII_CONTROL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+
+
+class _CharTable(dict):
+    """
+    Maps code points to their normalised string, filled in the first time a character is seen.
+
+    Characters are case-folded and compatibility-decomposed, combining marks (accents) and non-printable characters
+    other than whitespace are dropped. Can be passed to :meth:`str.translate`.
+    """
+
+    def __missing__(self, ordinal: int) -> str:
+        char = chr(ordinal)
+        if char.isspace():
+            normalised = char
+        else:
+            normalised = ''.join(
+                c for c in unicodedata.normalize('NFKD', char.casefold())
+                if c.isprintable() and not unicodedata.combining(c)
+            )
+        self[ordinal] = normalised
+        return normalised
+
+
+CHAR_TABLE = _CharTable()
+
+
+def normalise(text: str) -> str:
+    return text.translate(CHAR_TABLE)
+
+
+class Alignment(NamedTuple):
+    # character offsets of the labelled spans, (start, end, category)
+    entities: List[Tuple[int, int, str]]
+    # positions of the tokens that could not be found in the text
+    unaligned: List[int]
+    # character offset after the last aligned token
+    end: int
+
+
+class Aligner:
+    """
+    Aligns tokens to the text they were taken from.
+
+    The text is normalised once (see :class:`_CharTable`) and every normalised character remembers the position of
+    the character it came from, so that matches in the normalised text translate back to offsets into the original
+    text. Tokens are searched in order, each one after the previous match, so a sequence of tokens is aligned in a
+    single pass over the text, without copying it.
+
+    Args:
+        text: The text to align tokens to.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        if text.isascii() and not _ASCII_CONTROL.search(text):
+            self.normalised = text.lower()
+            # positions are unchanged
+            self.origin: Optional[List[int]] = None
+            self.position: Optional[List[int]] = None
+        else:
+            pieces = [CHAR_TABLE[ord(c)] for c in text]
+            self.normalised = ''.join(pieces)
+            # original position of every normalised character
+            self.origin = [i for i, piece in enumerate(pieces) for _ in piece]
+            # normalised position of every original character (and of the end of the text)
+            self.position = [0, *accumulate(len(piece) for piece in pieces)]
+
+    def find(self, token: str, offset: int = 0) -> Optional[Tuple[int, int]]:
+        """
+        Finds the first occurrence of a token in the text, at or after `offset`.
+
+        Args:
+            token: The token to find.
+            offset: Character offset in the text to start searching from.
+
+        Returns:
+            Start and end offset of the token in the text, or None if it is not found.
+
+        """
+        token = normalise(token)
+        if not token:
+            return None
+        start = self.normalised.find(token, offset if self.position is None else self.position[offset])
+        if start < 0:
+            return None
+        end = start + len(token)
+        if self.origin is None:
+            return start, end
+        return self.origin[start], self.origin[end - 1] + 1
+
+    def align(self, annotation: Iterable[Tuple[str, str]], offset: int = 0) -> Alignment:
+        """
+        Aligns BIO-labelled tokens to the text and converts them to labelled character offsets.
+
+        Tokens that can't be found are skipped and reported.
+
+        Args:
+            annotation: `(token, label)` pairs, in text order.
+            offset: Character offset in the text to start aligning from.
+
+        Returns:
+            The labelled spans, the unaligned tokens and the offset after the last aligned token.
+
+        """
+        entities = []
+        unaligned = []
+        for i, (token, label) in enumerate(annotation):
+            span = self.find(token, offset)
+            if span is None:
+                unaligned.append(i)
+                continue
+            start, end = span
+            if label != "O":
+                tag, category = label.split('-', 1)
+                # like bio_generator, an I-tag continues the last labelled span
+                if tag == "I" and entities:
+                    entities[-1] = (entities[-1][0], end, category)
+                elif tag in ("B", "I"):
+                    entities.append((start, end, category))
+            offset = end
+        return Alignment(entities, unaligned, offset)
+
+    def align_sentences(self, annotation: Iterable[Iterable[Tuple[str, str]]], offset: int = 0) -> Alignment:
+        """
+        Aligns BIO-labelled tokens, grouped by sentence, to the text. Labelled spans don't continue across sentences.
+
+        Args:
+            annotation: `(token, label)` pairs of every sentence, in text order.
+            offset: Character offset in the text to start aligning from.
+
+        Returns:
+            The labelled spans, the unaligned tokens (counted across sentences) and the offset after the last aligned
+            token.
+
+        """
+        entities = []
+        unaligned = []
+        seen = 0
+        for sentence in annotation:
+            sentence = list(sentence)
+            alignment = self.align(sentence, offset)
+            entities.extend(alignment.entities)
+            unaligned.extend(seen + i for i in alignment.unaligned)
+            seen += len(sentence)
+            offset = alignment.end
+        return Alignment(entities, unaligned, offset)
+
+
+def _align(text: str, annotation, sentences: bool) -> Tuple[List[Tuple[int, int, str]], int]:
+    aligner = Aligner(text)
+    alignment = aligner.align_sentences(annotation) if sentences else aligner.align(annotation)
+    return alignment.entities, len(alignment.unaligned)
+
+
+def align_batch(texts: Sequence[str], annotations: Sequence[Iterable], sentences: bool = False, n_process: int = 1,
+                chunk_size: int = 256, start_method: str = None) -> List[List[Tuple[int, int, str]]]:
+    """
+    Converts the BIO-labelled tokens of many texts to labelled character offsets at once.
+
+    With `n_process > 1`, the texts are aligned by a pool of worker processes, `chunk_size` texts per task, e.g. to
+    import large dumps of annotations. Tokens that can't be aligned are skipped, with one warning for the batch.
+
+    Args:
+        texts: The texts.
+        annotations: For every text, its `(token, label)` pairs or, with `sentences`, its sentences of
+            `(token, label)` pairs. Must be picklable when aligning in worker processes.
+        sentences: Whether the annotations are grouped by sentence (see :meth:`Aligner.align_sentences`).
+        n_process: Number of worker processes.
+        chunk_size: Number of texts sent to a worker process at once.
+        start_method: Multiprocessing start method, e.g. 'fork' or 'spawn'.
+
+    Returns:
+        For every text, its labelled spans as `(start, end, category)`, ready to be set as named entities.
+
+    """
+    if len(texts) != len(annotations):
+        raise ValueError(f"Got {len(texts)} texts but {len(annotations)} annotations!")
+    arguments = zip(texts, annotations, repeat(sentences))
+    if n_process > 1:
+        with multiprocessing.get_context(start_method).Pool(n_process) as pool:
+            results = pool.starmap(_align, arguments, chunksize=chunk_size)
+    else:
+        results = [_align(*args) for args in arguments]
+    unaligned = sum(n for _, n in results)
+    if unaligned:
+        logger.warning(f"Could not align {unaligned} tokens of {len(texts)} texts, skipping them.")
+    return [entities for entities, _ in results]
@@ -1,11 +1,13 @@
 from allennlp.data import Instance
+from allennlp.data.fields import TextField
 from allennlp.models import load_archive
 from allennlp.predictors import Predictor
 from loguru import logger
 from overrides import overrides
 from spacy.tokens import Doc
-from typing import Callable, Any, Dict, Optional, List
+from typing import Callable, Any, Dict, Optional, List, Union
 from tmdm.classes import CharOffsetAnnotation, Provider
+from tmdm.util import predict_bucketed
 
 default = object()
 
@@ -17,6 +19,7 @@ class OnlineProvider(Provider):
             preprocessor: Optional[Callable[[Doc], Instance]] = default,
             converter: Callable[[Doc, Any], CharOffsetAnnotation] = None,
             cuda=-1,
+            max_tokens: int = None,
     ):
         super().__init__()
 
@@ -26,6 +29,7 @@ class OnlineProvider(Provider):
         self.task = task
         self.path = path
         self.cuda = cuda
+        self.max_tokens = max_tokens
         if self.path:
             self.load(path)
 
@@ -49,12 +53,23 @@ class OnlineProvider(Provider):
             [[word.text for word in sentence] for sentence in doc.sents]
         )
 
+    @staticmethod
+    def _length(instance: Union[Instance, Doc]) -> int:
+        # without a preprocessor, the predictor is given the docs themselves
+        if isinstance(instance, Doc):
+            return len(instance) or 1
+        return sum(len(field) for field in instance.fields.values() if isinstance(field, TextField)) or 1
+
     @overrides
     def annotate_batch(self, docs: List[Doc]) -> List[CharOffsetAnnotation]:
         logger.trace("Entering annotate batch...")
         instances = [self.preprocess(doc) for doc in docs] if self.preprocess else docs
         # try:
-        result = self.predictor.predict_batch_instance(instances)
+        if self.max_tokens:
+            result = predict_bucketed(instances, self.predictor.predict_batch_instance, self.max_tokens,
+                                      length=self._length)
+        else:
+            result = self.predictor.predict_batch_instance(instances)
         logger.trace(f"Result: {result}")
         # except Exception as e:
         #    logger.error(str(e))
@@ -10,14 +10,14 @@ from math import ceil
 
 # from spacy.gold import offsets_from_biluo_tags, iob_to_biluo
 from spacy.tokens import Doc, Token, Span
-from typing import List, Dict
+from typing import List, Dict, Optional
 import numpy as np
 from spacy.training.iob_utils import offsets_from_biluo_tags, iob_to_biluo
 
 from tmdm.allennlp.common import OnlineProvider
 from tmdm.classes import CharOffsetAnnotation
 
-from tmdm.util import entities_relations_from_by_verb
+from tmdm.util import entities_relations_from_by_verb, predict_bucketed
 from tmdm.pipe.pipe import PipeElement
 
 ModelOutput = Dict[str, np.ndarray]
@@ -108,6 +108,14 @@ def _extract_predicates_simple(sent: Span) -> List[List[int]]:
 @Predictor.register("open-information-extraction", exist_ok=True)
 class CustomOpenIEPredictor(OpenIePredictor):
     simple_predicates: bool
+    # token budget per forward pass over the sentence/predicate instances, if any
+    max_tokens: Optional[int] = None
+
+    def _forward(self, instances: List[Instance]):
+        if self.max_tokens:
+            return predict_bucketed(instances, self._model.forward_on_instances, self.max_tokens,
+                                    length=OnlineProvider._length)
+        return self._model.forward_on_instances(instances)
 
     def predict_batch_instance(self, instances: List[Instance]) -> List[JsonDict]:
         # noinspection PyTypeChecker
@@ -136,7 +144,7 @@ class CustomOpenIEPredictor(OpenIePredictor):
         flat_instances = [inst for _, sents in instances.items() for sent in sents for inst in sent]
         if flat_instances:
             try:
-                results = self._model.forward_on_instances(flat_instances)
+                results = self._forward(flat_instances)
             except Exception as e:
                 if "memory" in str(e).lower():
                     current_batch_size = ceil(len(flat_instances) / 2)
@@ -209,19 +217,22 @@ def _convert_annotations(doc: Doc, annotations: List[List[List[str]]]) -> CharOf
     return entities_relations_from_by_verb(result)
 
 
-def get_oie_provider(model_path: str, simple_predicates: bool = False, cuda=-1):
+def get_oie_provider(model_path: str, simple_predicates: bool = False, cuda=-1, max_tokens: int = None):
     import allennlp_models.tagging
     p = OnlineProvider(task='open-information-extraction', path=model_path, converter=_convert_annotations,
                        preprocessor=None, cuda=cuda)
     p.predictor.simple_predicates = simple_predicates
+    # the predictor expands the docs into sentence/predicate instances, which are what the budget applies to
+    p.predictor.max_tokens = max_tokens
     return p
 
 
 def get_oie_pipe(model_path: str = 'https://storage.googleapis.com/allennlp-public-models/openie-model.2020.03.26.tar.gz',
-                 simple_predicates: bool = False, cuda=-1):
+                 simple_predicates: bool = False, cuda=-1, max_tokens: int = None):
     import allennlp_models.tagging
     # converter = convert_clusters_to_offsets
     # getter = itemgetter("clusters")
     p = OnlineProvider(task='open-information-extraction', path=model_path, converter=_convert_annotations, preprocessor=None, cuda=cuda)
     p.predictor.simple_predicates = simple_predicates
+    p.predictor.max_tokens = max_tokens
     return PipeElement(name='open-ie', field='oies', provider=p)
@@ -1,4 +1,4 @@
-from typing import Dict, Any, Union, Callable
+from typing import Any, Union, Callable, Mapping, MutableMapping, List, Iterable, Optional
 
 from loguru import logger
 from overrides import overrides
@@ -9,13 +9,21 @@ from spacy.training.iob_utils import offsets_from_biluo_tags
 
 from tmdm import util
 from tmdm.classes import Provider, CharOffsetAnnotation
+from tmdm.stores import SqliteStore
 from tmdm.util import convert_clusters_to_offsets, get_offsets, get_offsets_from_sentences, get_offsets_from_brat
 
 OFFSETS = object()
 
 
+def _checked_offsets(doc: Doc, annotation: dict) -> Optional[CharOffsetAnnotation]:
+    if annotation['checksum'] != util.content_hash(doc.text):
+        logger.warning(f"Text of doc {doc._.id} changed since its annotations were converted, skipping them.")
+        return None
+    return annotation['offsets']
+
+
 class Cached(Provider):
-    cache: Dict[str, Any]
+    cache: Mapping[str, Any]
     name = 'cached'
     known_schemas = {
         # these assume same tokenisation
@@ -36,20 +44,24 @@ class Cached(Provider):
 
         # annotation: List[Tuple[List[str]], Tuple[List[str]]]
         "list_of_tuples_of_lists": lambda doc, annotation:
-        get_offsets_from_sentences(doc.text, ((w, l) for t in annotation for w, l in zip(*t[:2]))),
+        get_offsets_from_sentences(doc.text, (zip(*t[:2]) for t in annotation)),
 
         # annotation: Tuple[List[List[str]], Tuple[List[List[str]]
         "tuple_of_lists_of_lists": lambda doc, annotation:
-        get_offsets_from_sentences(doc.text, ((w, l) for ws, ls in zip(*annotation[:2]) for w, l in zip(ws, ls))),
+        get_offsets_from_sentences(doc.text, (zip(ws, ls) for ws, ls in zip(*annotation[:2]))),
 
         "brat": get_offsets_from_brat,
         # TODO: Pubmed
+
+        # annotation: {'offsets': CharOffsetAnnotation, 'checksum': str}, as written by Cached.convert
+        "checked_offsets": _checked_offsets,
     }
 
     def __init__(self, schema: Union[str, Callable[[Doc, Any], CharOffsetAnnotation]] = None, getter=None,
-                 path: str = None):
+                 path: str = None, id_field: str = 'id'):
         self.cache = {}
         self.loaded = False
+        self.id_field = id_field
         if not schema:
             self.schema = OFFSETS
         elif schema in self.known_schemas:
@@ -70,9 +82,38 @@ class Cached(Provider):
 
     @overrides
     def load(self, path):
-        self.cache = util.load_file(path)
+        self.cache = util.load_file(path, id_field=self.id_field)
         self.loaded = True
 
+    def convert(self, docs: Iterable[Doc], path: str, format: str = None) -> 'Cached':
+        """
+        Resolves the cached annotations of the docs to character offsets once and writes them to a new cache.
+
+        Replaying the converted cache with the 'checked_offsets' schema is a lookup, without aligning the annotations
+        to the text again. Every record keeps a checksum of the text it was aligned to, so that annotations of docs
+        whose text changed since are skipped rather than misplaced.
+
+        Args:
+            docs: Docs to convert the annotations of, e.g. from :meth:`tmdm.pipe.pipe.Pipeline.preprocess_stream`.
+            path: Path to write the converted cache to, preferably an 'mpkx' store.
+            format: Format of the converted cache, inferred from the path by default. Must be a format that
+                :func:`tmdm.util.save_file` can write, i.e. not 'jsonl'.
+
+        Returns:
+            Provider replaying the converted cache.
+
+        """
+        format = util.save_format(path, format)
+        records = (
+            (doc._.id, {'offsets': annotations, 'checksum': util.content_hash(doc.text)})
+            for doc, annotations in ((doc, self.annotate_document(doc)) for doc in docs) if annotations is not None
+        )
+        if format != 'mpkx':
+            records = dict(records)
+        util.save_file(records, path, format)
+        logger.info(f"Converted cache written to '{path}'.")
+        return Cached(schema='checked_offsets', path=path)
+
     @overrides
     def annotate_document(self, doc: Doc) -> CharOffsetAnnotation:
         if not self.loaded:
@@ -87,3 +128,67 @@ class Cached(Provider):
             else:
                 logger.info(f"no schema loaded for {self.__class__.__name__}, good luck!")
                 return annotations
+
+
+class CachingProvider(Provider):
+    """
+    Wraps a provider and records its annotations in a persistent store.
+
+    Documents are looked up in the store first; only the misses are sent to the wrapped provider and its annotations
+    are written back, so that re-running over mostly unchanged corpora only annotates the new documents. Annotations
+    are always returned as read from the store.
+
+    Args:
+        inner: The provider to wrap.
+        store: Writable mapping to record the annotations in, e.g. a :class:`tmdm.stores.SqliteStore`, or a path to
+            an SQLite database.
+        key: How to identify a document, either 'id' for its `doc._.id`, 'text' for a content hash of its text, or a
+            callable.
+    """
+
+    def __init__(self, inner: Provider, store: Union[MutableMapping, str],
+                 key: Union[str, Callable[[Doc], str]] = 'id'):
+        if not (key in ('id', 'text') or isinstance(key, Callable)):
+            raise ValueError(f"Unknown key '{key}', use 'id', 'text' or a callable!")
+        self.inner = inner
+        self.store = SqliteStore(store) if isinstance(store, str) else store
+        self.key = key
+
+    @property
+    def name(self) -> str:
+        return f'caching-{self.inner.name}'
+
+    @overrides
+    def save(self, path: str):
+        # annotations are written to the store as they come in
+        ...
+
+    @overrides
+    def load(self, path: str):
+        self.store = SqliteStore(path)
+
+    def _key(self, doc: Doc) -> str:
+        if self.key == 'id':
+            return f"{self.inner.name}/{doc._.id}"
+        elif self.key == 'text':
+            return f"{self.inner.name}/{util.content_hash(doc.text)}"
+        return self.key(doc)
+
+    @overrides
+    def annotate_document(self, doc: Doc) -> CharOffsetAnnotation:
+        return self.annotate_batch([doc])[0]
+
+    @overrides
+    def annotate_batch(self, docs: List[Doc]) -> List[CharOffsetAnnotation]:
+        keys = [self._key(doc) for doc in docs]
+        results = [self.store.get(key, None) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        logger.debug(f"{len(docs) - len(misses)}/{len(docs)} docs found in store.")
+        if misses:
+            annotated = self.inner.annotate_batch([docs[i] for i in misses])
+            assert len(annotated) == len(misses)
+            self.store.update([(keys[i], annotations) for i, annotations in zip(misses, annotated)])
+            # read back, so that misses come in the same shape as hits, e.g. lists rather than tuples from msgpack
+            for i in misses:
+                results[i] = self.store[keys[i]]
+        return results
@@ -0,0 +1,238 @@
+import copy
+import difflib
+import zlib
+from collections import defaultdict, OrderedDict
+from typing import List, Optional, Callable, Dict, Tuple, Any
+
+import numpy as np
+from loguru import logger
+from overrides import overrides
+from spacy.tokens import Doc
+
+from tmdm import util
+from tmdm.classes import Provider, CharOffsetAnnotation, ERTuple
+from tmdm.model.extensions import memo_table
+
+_PRIME = (1 << 31) - 1
+
+
+class MinHasher:
+    """
+    MinHash signatures over character shingles, for estimating the Jaccard similarity of texts.
+
+    Args:
+        num_perm: Number of hash functions, i.e. length of a signature.
+        shingle_size: Number of characters per shingle.
+        seed: Seed for drawing the hash functions.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        random = np.random.RandomState(seed)
+        self.a = random.randint(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self.b = random.randint(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        text = " ".join(text.lower().split())
+        n = self.shingle_size
+        shingles = {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) & _PRIME for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        return ((np.outer(hashes, self.a) + self.b) % _PRIME).min(axis=0)
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.mean(first == second))
+
+
+def _offset_mapper(source: str, target: str) -> Optional[Callable[[int, int], Optional[Tuple[int, int]]]]:
+    opcodes = difflib.SequenceMatcher(None, source, target, autojunk=False).get_opcodes()
+    # text that only the target has might hold annotations the source can't provide
+    if any(tag in ('insert', 'replace') for tag, *_ in opcodes):
+        return None
+    blocks = [(i1, i2, j1 - i1) for tag, i1, i2, j1, _ in opcodes if tag == 'equal']
+
+    def mapper(start: int, end: int) -> Optional[Tuple[int, int]]:
+        for block_start, block_end, delta in blocks:
+            if block_start <= start and end <= block_end:
+                return start + delta, end + delta
+        return None
+
+    return mapper
+
+
+def _project_spans(spans: List, mapper) -> Optional[List]:
+    projected = []
+    for start, end, *rest in spans:
+        offsets = mapper(start, end)
+        if offsets is None:
+            return None
+        projected.append((*offsets, *copy.deepcopy(rest)))
+    return projected
+
+
+def _is_entities_relations(annotations: CharOffsetAnnotation) -> bool:
+    if isinstance(annotations, tuple):
+        return True
+    # e.g. read back from json or msgpack: [[(start, end, label), ...], [(head, tail, label), ...]]
+    return (len(annotations) == 2 and all(isinstance(a, list) for a in annotations)
+            and bool(annotations[0]) and isinstance(annotations[0][0], (list, tuple)))
+
+
+def project_annotations(annotations: CharOffsetAnnotation, source: str, target: str) -> Optional[CharOffsetAnnotation]:
+    """
+    Moves character offset annotations of one text onto a (near-)identical other text.
+
+    Annotations are shifted along the parts both texts have in common. This only works if the target is the source
+    with parts left out: text that only the target has might hold annotations of its own. Entity-relationship
+    annotations keep their relations, which refer to the entities by index.
+
+    Args:
+        annotations: Annotations of the source text, either entities or entities and relations.
+        source: Text the annotations belong to.
+        target: Text to move the annotations to.
+
+    Returns:
+        The annotations of the target text or None, if the target has text the source doesn't have or any of the
+        annotated spans differs between the texts.
+
+    """
+    if source == target:
+        return copy.deepcopy(annotations)
+    if annotations is None:
+        return None
+    mapper = _offset_mapper(source, target)
+    if mapper is None:
+        return None
+    try:
+        if _is_entities_relations(annotations):
+            entities, relations = annotations
+            entities = _project_spans(entities, mapper)
+            return None if entities is None else ERTuple(entities, copy.deepcopy(relations))
+        return _project_spans(annotations, mapper)
+    except (TypeError, ValueError):
+        logger.debug("Cannot project annotations of unknown format.")
+        return None
+
+
+class DeduplicatingProvider(Provider):
+    """
+    Wraps a provider so that duplicate and near-duplicate documents are only annotated once.
+
+    Documents are grouped by exact content hash and by MinHash similarity (with LSH banding to find candidates).
+    Only one representative per group is sent to the wrapped provider; its annotations are projected onto the other
+    members of the group. Near-duplicates that have text of their own, or whose annotated spans can't be projected,
+    are annotated themselves.
+    Representatives are remembered across batches, up to `max_representatives`.
+
+    Args:
+        inner: The provider to wrap.
+        threshold: Minimum estimated Jaccard similarity of the character shingles of two near-duplicates.
+        num_perm: Length of the MinHash signatures.
+        bands: Number of LSH bands, must divide `num_perm`.
+        shingle_size: Number of characters per shingle.
+        max_representatives: Maximum number of representatives (and their annotations) to remember.
+    """
+
+    def __init__(self, inner: Provider, threshold: float = 0.9, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, max_representatives: int = 10000):
+        if num_perm % bands:
+            raise ValueError(f"Number of bands ({bands}) must divide num_perm ({num_perm})!")
+        self.inner = inner
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.bands = bands
+        self.max_representatives = max_representatives
+        # content hash -> (text, signature, annotations)
+        self.representatives: 'OrderedDict[str, Tuple[str, np.ndarray, Any]]' = OrderedDict()
+        self.buckets: Dict[Tuple[int, bytes], List[str]] = defaultdict(list)
+
+    @property
+    def name(self) -> str:
+        return f'dedup-{self.inner.name}'
+
+    @overrides
+    def save(self, path: str):
+        self.inner.save(path)
+
+    @overrides
+    def load(self, path: str):
+        self.inner.load(path)
+
+    def _signature(self, doc: Doc) -> np.ndarray:
+        signatures = memo_table(doc, 'minhash')
+        key = (self.hasher.num_perm, self.hasher.shingle_size)
+        if key not in signatures:
+            signatures[key] = self.hasher.signature(doc.text)
+        return signatures[key]
+
+    def _bands(self, signature: np.ndarray):
+        rows = len(signature) // self.bands
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def _find(self, digest: str, signature: np.ndarray) -> Optional[str]:
+        if digest in self.representatives:
+            return digest
+        candidates = {c for band in self._bands(signature) for c in self.buckets.get(band, ())}
+        best = max(candidates, key=lambda c: self.hasher.similarity(signature, self.representatives[c][1]),
+                   default=None)
+        if best is not None and self.hasher.similarity(signature, self.representatives[best][1]) >= self.threshold:
+            return best
+        return None
+
+    def _remember(self, digest: str, text: str, signature: np.ndarray, annotations: Any):
+        if digest not in self.representatives:
+            for band in self._bands(signature):
+                self.buckets[band].append(digest)
+        self.representatives[digest] = (text, signature, annotations)
+        while len(self.representatives) > self.max_representatives:
+            evicted, (_, evicted_signature, _) = self.representatives.popitem(last=False)
+            for band in self._bands(evicted_signature):
+                self.buckets[band].remove(evicted)
+                if not self.buckets[band]:
+                    del self.buckets[band]
+
+    @overrides
+    def annotate_document(self, doc: Doc) -> CharOffsetAnnotation:
+        return self.annotate_batch([doc])[0]
+
+    @overrides
+    def annotate_batch(self, docs: List[Doc]) -> List[CharOffsetAnnotation]:
+        # representative of every doc, as (text, annotations); the annotations of new representatives come later
+        groups: List[Optional[str]] = []
+        known: Dict[str, Tuple[str, Any]] = {}
+        new: 'OrderedDict[str, int]' = OrderedDict()
+        for i, doc in enumerate(docs):
+            digest = util.content_hash(doc.text)
+            signature = self._signature(doc)
+            match = digest if digest in new else self._find(digest, signature)
+            if match is None:
+                new[digest] = i
+                match = digest
+                # remember it right away, so that the following docs of the batch can match it
+                self._remember(digest, doc.text, signature, None)
+            elif match not in new:
+                text, _, annotations = self.representatives[match]
+                known[match] = (text, annotations)
+            groups.append(match)
+        if new:
+            annotated = self.inner.annotate_batch([docs[i] for i in new.values()])
+            for (digest, i), annotations in zip(new.items(), annotated):
+                known[digest] = (docs[i].text, annotations)
+                if digest in self.representatives:
+                    self._remember(digest, docs[i].text, self._signature(docs[i]), annotations)
+        logger.debug(f"Annotated {len(new)} representatives for {len(docs)} docs.")
+
+        results = []
+        unprojected = []
+        for i, (doc, group) in enumerate(zip(docs, groups)):
+            text, annotations = known[group]
+            projected = project_annotations(annotations, text, doc.text)
+            if projected is None:
+                unprojected.append(i)
+            results.append(projected)
+        if unprojected:
+            for i, annotations in zip(unprojected, self.inner.annotate_batch([docs[i] for i in unprojected])):
+                results[i] = annotations
+        return results
@@ -27,7 +27,7 @@ def default_one_sent_getter(d):
 
 
 def tmdm_pipeline(getter: Optional[Callable[[Any, ], Tuple[str, str]]] = None, model='en_core_web_sm',
-                  disable=None, with_ids=False) -> Pipeline:
+                  disable=None, with_ids=False, content_ids=False) -> Pipeline:
     disable = disable or ['ner', 'parse']
     nlp = spacy.load(model, disable=disable)
     # if not with_ids:
@@ -38,7 +38,7 @@ def tmdm_pipeline(getter: Optional[Callable[[Any, ], Tuple[str, str]]] = None, m
     #     change_getter(nlp, getter)
     if not getter and with_ids:
         raise ValueError("Data comes with ids, but no getter configured!")
-    return Pipeline(nlp, pipes=None, getter=getter, generate_ids=not with_ids)
+    return Pipeline(nlp, pipes=None, getter=getter, generate_ids=not with_ids, content_ids=content_ids)
 
 
 # def tmdm_scientific_pipeline(getter: Callable[[Any, ], Tuple[str, str]] = default_getter, model="en_core_sci_lg"):
@@ -1,13 +1,15 @@
-from typing import List, Iterable, Optional, Union
-from fastcache import clru_cache
+from typing import List, Iterable, Optional, Union, Dict, Any
+
+import numpy as np
 from spacy.tokens import Doc, Token, Span
 from loguru import logger
 
-from tmdm.model.extensions import Annotation, extend
+from tmdm.model.extensions import Annotation, AnnotationView, Adjacency, extend, memo_table, interval_index, \
+    invalidate_interval_index, token_membership, invalidate_token_membership
 
 
 # ATTRIBUTES
-@extend(Token, type='property', create_attribute=True, default=[])
+@extend(Token, type='property', create_attribute=False)
 def corefs(self: Token):
     """
 
@@ -19,9 +21,10 @@ def corefs(self: Token):
 
     """
     logger.debug(f"Retrieving coref annotations for token '{self}'")
-    logger.debug(f"Result is: '{self._._corefs}'")
+    members = token_membership(self.doc, 'corefs', self.doc._._corefs)[self.i]
+    logger.debug(f"Result is: '{members}'")
     return [
-        Coreference.make(self.doc, i) for i in self._._corefs
+        Coreference.make(self.doc, i) for i in members
     ]
 
 
@@ -31,24 +34,22 @@ def set_corefs(self, corefs):
     if self._._corefs:
         logger.error("Cannot re-set tokens (yet)!")
         raise NotImplementedError("Cannot re-set tokens (yet)!")
-    for idx, (start, end, label) in enumerate(corefs):
-        logger.trace(corefs)
-        for token in self._.char_span_relaxed(start, end):
-            annotations = token._._corefs
-            if idx not in annotations:
-                annotations.append(idx)
-
     self._._corefs = corefs
+    invalidate_interval_index(self, 'corefs')
+    invalidate_token_membership(self, 'corefs')
+    token_membership(self, 'corefs', corefs)
+    _build_clusters(self)
+
+
+def _index(doc: Doc):
+    return interval_index(doc, 'corefs', doc._._corefs)
 
 
 @extend(Span)
 def get_coref(self: Span) -> Optional['Coreference']:
     start = self[0].idx
     end = self[-1].idx + len(self[-1])
-    return next(
-        (Coreference.make(self.doc, i) for i, (s, e, _) in enumerate(self.doc._._corefs) if start == s and end == e),
-        None
-    )
+    return next((Coreference.make(self.doc, i) for i in _index(self.doc).exact_matches(start, end)), None)
 
 
 @extend(Span)
@@ -61,9 +62,7 @@ def get_corefs(self: Span):
     start = self[0].idx
     end = self[-1].idx + len(self[-1])
     logger.trace(f"start,end: {start},{end}")
-    return [
-        Coreference.make(self.doc, i) for i, (s, e, _) in enumerate(self.doc._._corefs) if start <= s and end >= e
-    ]
+    return [Coreference.make(self.doc, i) for i in _index(self.doc).contained_in(start, end)]
 
 
 @extend(Span)
@@ -97,9 +96,29 @@ def _l2c(label: str) -> int:
     return int(label.split("-")[-1])
 
 
-@clru_cache(maxsize=100000)
+def _build_clusters(doc: Doc) -> Dict[str, Any]:
+    clusters = memo_table(doc, 'coref_clusters')
+    # cluster id of every mention, parsed from its label once
+    ids = np.fromiter((_l2c(label) for _, _, label in doc._._corefs), dtype=np.int64, count=len(doc._._corefs))
+    clusters['unique'], codes = np.unique(ids, return_inverse=True)
+    clusters['ids'] = ids
+    clusters['members'] = Adjacency(codes, np.arange(len(ids)), len(clusters['unique']))
+    return clusters
+
+
+def _clusters(doc: Doc) -> Dict[str, Any]:
+    clusters = memo_table(doc, 'coref_clusters')
+    if not clusters:
+        clusters = _build_clusters(doc)
+    return clusters
+
+
 def _cluster(doc: Doc, cluster_id: int) -> Iterable['Coreference']:
-    return [Coreference.make(doc, i) for i, (_, _, label) in enumerate(doc._._corefs) if _l2c(label) == cluster_id]
+    clusters = _clusters(doc)
+    code = int(np.searchsorted(clusters['unique'], cluster_id))
+    if code == len(clusters['unique']) or clusters['unique'][code] != cluster_id:
+        return []
+    return [Coreference.make(doc, i) for i in clusters['members'][code]]
 
 
 class Coreference(Annotation):
@@ -121,5 +140,22 @@ class Coreference(Annotation):
     def make(cls, doc: Doc, idx, *args, **kwargs) -> 'Coreference':
         start, end, label = doc._._corefs[idx]
         coref = super().make(doc, idx, start, end, label)
-        coref.cluster_id = _l2c(label)
+        coref.cluster_id = int(_clusters(doc)['ids'][idx])
         return coref
+
+
+class CoreferenceView(AnnotationView):
+    __slots__ = ()
+    annotation = Coreference
+
+    @property
+    def cluster_id(self) -> int:
+        return int(_clusters(self.doc)['ids'][self.idx])
+
+
+@extend(Doc, 'property', create_attribute=False)
+def coref_views(self: Doc) -> List[CoreferenceView]:
+    """
+    Views of the coreference mentions of the document, for iterating over them without creating spans.
+    """
+    return [CoreferenceView(self, i, start, end, label) for i, (start, end, label) in enumerate(self._._corefs)]
@@ -1,9 +1,11 @@
-import itertools
-from collections import defaultdict
-from typing import Tuple, Union, Callable, Dict, List, Type
+import threading
+import weakref
+from collections import defaultdict, OrderedDict
+from typing import Tuple, Union, Callable, Dict, List, Type, Optional, Any, Iterable
 
-from fastcache import clru_cache
+import numpy as np
 from loguru import logger
+from spacy.attrs import IDX, LENGTH
 from spacy.tokens.doc import Doc
 from spacy.tokens.span import Span
 from spacy.tokens.token import Token
@@ -34,24 +36,294 @@ def extend(target: Union[Doc, Token, Span], type='method', setter=None, default=
 # ATTRIBUTES
 Doc.set_extension('id', default=None, force=force)
 
+# derived, per-document data; kept next to the docs rather than in `doc.user_data`, which spaCy serialises
+_MEMO: 'weakref.WeakKeyDictionary[Doc, Dict[str, Dict]]' = weakref.WeakKeyDictionary()
+
+
+def memo_table(doc: Doc, name: str) -> Dict:
+    """
+    Per-document memo table.
+
+    The tables are held for as long as the document lives and are freed together with it. They are not part of the
+    document's `user_data`, so they are neither serialised nor pickled with it, and are rebuilt on first use instead.
+
+    Args:
+        doc: Document the memoised values belong to.
+        name: Name of the table, usually the name of the memoised function.
+
+    Returns:
+        The (mutable) memo table.
+
+    """
+    tables = _MEMO.get(doc)
+    if tables is None:
+        tables = _MEMO.setdefault(doc, {})
+    table = tables.get(name)
+    if table is None:
+        table = tables.setdefault(name, {})
+    return table
+
+
+def clear_memo(doc: Doc, *names: str):
+    """
+    Drops memo tables of a document, e.g. when the annotations they were computed from change.
+
+    Args:
+        doc: Document to clear the tables of.
+        *names: Names of the tables to drop. Drops all tables if none are given.
+
+    """
+    tables = _MEMO.get(doc)
+    if tables is None:
+        return
+    if not names:
+        tables.clear()
+    for name in names:
+        tables.pop(name, None)
+
+
+class IntervalIndex:
+    """
+    Index over the character offsets of one annotation layer.
+
+    Answers exact-match and containment queries without scanning all annotations. Query results are indices into
+    the annotation list, in annotation order.
+
+    Args:
+        annotations: Annotations of the layer, as `(start, end, label)` tuples.
+    """
+
+    def __init__(self, annotations: List[Tuple[int, int, Any]]):
+        starts = np.fromiter((a[0] for a in annotations), dtype=np.int64, count=len(annotations))
+        ends = np.fromiter((a[1] for a in annotations), dtype=np.int64, count=len(annotations))
+        self.order = np.argsort(starts, kind='stable')
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        self.exact = defaultdict(list)
+        for i, (start, end, *_) in enumerate(annotations):
+            self.exact[(start, end)].append(i)
+
+    def exact_matches(self, start: int, end: int) -> List[int]:
+        return self.exact.get((start, end), [])
+
+    def contained_in(self, start: int, end: int) -> List[int]:
+        lo = np.searchsorted(self.starts, start, side='left')
+        hi = np.searchsorted(self.starts, end, side='right')
+        return sorted(self.order[lo:hi][self.ends[lo:hi] <= end].tolist())
+
+
+class Adjacency:
+    """
+    Compressed sparse row adjacency of `size` nodes, e.g. from verbs to their arguments.
+
+    The neighbours of all nodes are stored in one array, grouped by node, so that looking up the neighbours of a node
+    is a slice.
+
+    Args:
+        sources: Node of every edge.
+        targets: Neighbour of every edge.
+        size: Number of nodes.
+        sort_targets: Whether to sort the neighbours of a node, rather than keep them in edge order.
+        dtype: Integer type of the stored arrays.
+    """
+
+    def __init__(self, sources: Iterable[int], targets: Iterable[int], size: int, sort_targets: bool = False,
+                 dtype: Type[np.integer] = np.int64):
+        sources = np.fromiter(sources, dtype=np.int64)
+        targets = np.fromiter(targets, dtype=np.int64)
+        order = np.lexsort((targets, sources)) if sort_targets else np.argsort(sources, kind='stable')
+        self.indices = targets[order].astype(dtype)
+        self.indptr = np.zeros(size + 1, dtype=dtype)
+        np.cumsum(np.bincount(sources, minlength=size), out=self.indptr[1:])
+
+    def __getitem__(self, node: int) -> List[int]:
+        return self.indices[self.indptr[node]:self.indptr[node + 1]].tolist()
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.indptr.nbytes
+
+
+def interval_index(doc: Doc, layer: str, annotations: List[Tuple[int, int, Any]]) -> IntervalIndex:
+    """
+    Returns the interval index of an annotation layer, building it on first use.
+
+    Setters of a layer need to drop the index with :func:`invalidate_interval_index`.
+
+    Args:
+        doc: Document the annotations belong to.
+        layer: Name of the layer, e.g. 'nes'.
+        annotations: Annotations of the layer, used if the index needs to be built.
+
+    Returns:
+        The index.
+
+    """
+    indices = memo_table(doc, 'interval_index')
+    index = indices.get(layer)
+    if index is None:
+        index = indices[layer] = IntervalIndex(annotations)
+    return index
+
+
+def invalidate_interval_index(doc: Doc, layer: str):
+    memo_table(doc, 'interval_index').pop(layer, None)
+
+
+def token_ranges(doc: Doc, annotations: List[Tuple[int, int, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Token ranges of many annotations at once, the same as :func:`char_span_relaxed` would give them.
+
+    Args:
+        doc: Document the annotations belong to.
+        annotations: Annotations as `(start, end, label)` tuples.
+
+    Returns:
+        Index of the first token and of the token after the last one, of every annotation.
+
+    """
+    starts = np.fromiter((a[0] for a in annotations), dtype=np.int64, count=len(annotations))
+    ends = np.fromiter((a[1] for a in annotations), dtype=np.int64, count=len(annotations))
+    token_starts = doc._.token_starts
+    token_ends = token_starts + doc.to_array(LENGTH).astype(np.int32)
+    first = np.maximum(np.searchsorted(token_starts, starts, side='right') - 1, 0)
+    # where the annotation is aligned to tokens, it ends with the token ending at its end...
+    aligned_last = np.minimum(np.searchsorted(token_ends, ends, side='left'), len(doc) - 1)
+    aligned = (token_starts[first] == starts) & (token_ends[aligned_last] == ends) & (starts < ends)
+    # ... otherwise with the token its end falls in (or the last token)
+    relaxed_last = np.where(ends < len(doc.text), np.searchsorted(token_starts, ends, side='right'), len(doc))
+    return first, np.where(aligned, aligned_last + 1, relaxed_last)
+
+
+class TokenAnnotations:
+    """
+    Columnar store of the annotations that the tokens of a document are part of, for all annotation layers.
+
+    Per layer, the annotation indices of all tokens are kept in one `int32` array, grouped by token (see
+    :class:`Adjacency`), instead of a Python list per token. The store is a memo table of the document (see
+    :func:`memo_table`), rebuilt from the annotation layers after the document is restored.
+
+    Args:
+        n_tokens: Number of tokens of the document.
+    """
+
+    def __init__(self, n_tokens: int):
+        self.n_tokens = n_tokens
+        self.layers: Dict[str, Adjacency] = {}
+
+    def set(self, layer: str, first: np.ndarray, last: np.ndarray):
+        """
+        Stores the annotations of a layer, given by the token ranges from :func:`token_ranges`.
+        """
+        lengths = np.maximum(last - first, 0)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        tokens = np.repeat(first, lengths) + offsets
+        members = np.repeat(np.arange(len(first)), lengths)
+        self.layers[layer] = Adjacency(tokens, members, self.n_tokens, dtype=np.int32)
+
+    def get(self, layer: str) -> Optional[Adjacency]:
+        return self.layers.get(layer)
+
+    def drop(self, layer: str):
+        self.layers.pop(layer, None)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(layer.nbytes for layer in self.layers.values())
+
+
+def token_annotations(doc: Doc) -> TokenAnnotations:
+    table = memo_table(doc, 'token_annotations')
+    store = table.get('store')
+    if store is None or store.n_tokens != len(doc):
+        store = table['store'] = TokenAnnotations(len(doc))
+    return store
+
+
+def token_membership(doc: Doc, layer: str, annotations: List[Tuple[int, int, Any]]) -> Adjacency:
+    """
+    Returns the annotations of a layer that every token is part of, computing them on first use.
+
+    They are kept in the columnar token store of the document (see :class:`TokenAnnotations`). Setters of a layer
+    need to drop them with :func:`invalidate_token_membership`.
+
+    Args:
+        doc: Document the annotations belong to.
+        layer: Name of the layer, e.g. 'nes'.
+        annotations: Annotations of the layer, used if the membership needs to be computed.
+
+    Returns:
+        Adjacency from token indices to the indices of their annotations, in annotation order.
+
+    """
+    store = token_annotations(doc)
+    membership = store.get(layer)
+    if membership is None:
+        if len(doc) and annotations:
+            store.set(layer, *token_ranges(doc, annotations))
+        else:
+            store.set(layer, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        membership = store.get(layer)
+    return membership
+
+
+def invalidate_token_membership(doc: Doc, layer: str):
+    token_annotations(doc).drop(layer)
+
 
 # PROPERTIES
-@extend(Doc, 'property', create_attribute=True)
-def token_map(self: Doc):
-    # TODO: another candidate for porting to faster code
-    if not self._._token_map:
-        token_map = []
-        for i, token in enumerate(self):
-            token_map.extend([i] * (len(token) + (1 if token.whitespace_ else 0)))
-        self._._token_map = token_map
-    return self._._token_map
+@extend(Doc, 'property', create_attribute=False)
+def token_starts(self: Doc) -> np.ndarray:
+    """
+    Character offsets of the tokens of the document, as a sorted `numpy.int32` array.
+    """
+    tokens = memo_table(self, 'tokens')
+    if 'starts' not in tokens:
+        tokens['starts'] = self.to_array(IDX).astype(np.int32)
+    return tokens['starts']
+
+
+@extend(Doc, 'property', create_attribute=False)
+def token_map(self: Doc) -> np.ndarray:
+    """
+    Index of the token for each character of the document, as a `numpy.int32` array.
+
+    Whitespace is attributed to the token it follows. Prefer :func:`char_to_token` which doesn't need a
+    per-character array.
+    """
+    tokens = memo_table(self, 'tokens')
+    if 'map' not in tokens:
+        starts = self._.token_starts
+        lengths = np.diff(starts, append=len(self.text))
+        tokens['map'] = np.repeat(np.arange(len(starts), dtype=np.int32), lengths)
+    return tokens['map']
 
 
 # METHODS
+@extend(Doc)
+def char_to_token(self: Doc, char: int) -> int:
+    """
+    Index of the token a character belongs to, with whitespace attributed to the token it follows.
+
+    Args:
+        self: will be filled by partial
+        char: Character offset.
+
+    Returns:
+        The token index.
+
+    """
+    return int(np.searchsorted(self._.token_starts, char, side='right')) - 1
+
+
 @extend(Doc)
 def to_relative(self: Doc, start, end) -> Tuple[int, Tuple[int, int]]:
-    sent_start = self[start].sent[0].i
-    sent_nr = get_sent_nr(self[start].sent)
+    starts, _, token_to_sent = _sentence_table(self)
+    sent_nr = int(token_to_sent[start])
+    sent_start = int(starts[sent_nr])
     return sent_nr, (start - sent_start, end - sent_start)
 
 
@@ -74,16 +346,19 @@ def same(self: Span, other: Span):
 
 
 @extend(Doc)
-@clru_cache(maxsize=100000)
 def char_span_relaxed(self: Doc, start: int, end: int):
+    spans = memo_table(self, 'char_span_relaxed')
+    bounds = spans.get((start, end))
+    if bounds is not None:
+        return self[bounds[0]:bounds[1]]
     logger.trace(f"Computing not cached doc.char_span({start},{end})")
     span = self.char_span(start, end)
     if not span:
-        token_map = self._.token_map
-        try:
-            span = self[token_map[start]:token_map[end] + 1]
-        except IndexError:
-            span = self[token_map[start]:]
+        if end < len(self.text):
+            span = self[char_to_token(self, start):char_to_token(self, end) + 1]
+        else:
+            span = self[char_to_token(self, start):]
+    spans[(start, end)] = span.start, span.end
     return span
 
 
@@ -109,7 +384,8 @@ def isin(self: Span, item: Union[str, Span]):
 
 @extend(Doc)
 def to_absolute(self: Doc, sent_nr: int, start: int, end: int) -> Tuple[int, int]:
-    first_idx = get_sent(sent_nr)[0].i
+    starts, _, _ = _sentence_table(self)
+    first_idx = int(starts[sent_nr])
     return start + first_idx, end + first_idx
 
 
@@ -121,22 +397,98 @@ def contains(self: Span, item: Union[str, Span]):
         return isin(item, self)
 
 
+def _sentence_table(doc: Doc) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sentence boundaries of a document, built once per document.
+
+    Returns:
+        Start and end token of every sentence, and the sentence number of every token.
+
+    """
+    table = memo_table(doc, 'sentences')
+    if not table:
+        bounds = np.array([(sent.start, sent.end) for sent in doc.sents], dtype=np.int32).reshape(-1, 2)
+        table['starts'] = bounds[:, 0].copy()
+        table['ends'] = bounds[:, 1].copy()
+        table['token_to_sent'] = np.repeat(np.arange(len(bounds), dtype=np.int32), table['ends'] - table['starts'])
+    return table['starts'], table['ends'], table['token_to_sent']
+
+
 @extend(Doc)
 def get_sent_nr(self, sent: Span):
-    for i, s in enumerate(self.sents):
-        if s == sent:
+    starts, ends, token_to_sent = _sentence_table(self)
+    if sent.doc is self and 0 <= sent.start < len(token_to_sent):
+        i = int(token_to_sent[sent.start])
+        if starts[i] == sent.start and ends[i] == sent.end:
             return i
     raise ValueError(f"'{sent}' is not in '{self}'! ")
 
 
 @extend(Doc)
 def get_sent(self, n: int):
-    return next(itertools.islice(self.sents, n, n + 1))
+    starts, ends, _ = _sentence_table(self)
+    return self[int(starts[n]):int(ends[n])]
+
+
+class AnnotationCache:
+    """
+    Cache of materialised annotations, grouped by document.
+
+    Holds the annotations of at most `max_docs` documents and evicts the least recently used document first.
+    Documents are identified by their id; entries of a different :class:`Doc` object with the same id are replaced.
+
+    Args:
+        max_docs: Maximum number of documents to hold annotations for.
+    """
+
+    def __init__(self, max_docs: int = 1024):
+        self.max_docs = max_docs
+        self._docs: 'OrderedDict[Any, Tuple[Doc, Dict[Type, Dict[int, Span]]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cls: Type, doc: Doc, idx: int) -> Optional[Span]:
+        with self._lock:
+            entry = self._docs.get(doc._.id)
+            if entry is None or entry[0] is not doc:
+                return None
+            self._docs.move_to_end(doc._.id)
+            return entry[1][cls].get(idx)
+
+    def put(self, cls: Type, doc: Doc, idx: int, span: Span):
+        with self._lock:
+            entry = self._docs.get(doc._.id)
+            if entry is None or entry[0] is not doc:
+                entry = self._docs[doc._.id] = (doc, defaultdict(dict))
+            self._docs.move_to_end(doc._.id)
+            entry[1][cls][idx] = span
+            while len(self._docs) > self.max_docs:
+                evicted, _ = self._docs.popitem(last=False)
+                logger.trace(f"Evicting annotations of {evicted} from cache.")
+
+    def release(self, doc: Doc):
+        """
+        Drops all cached annotations of a document.
+
+        Args:
+            doc: Document to release.
+
+        """
+        with self._lock:
+            entry = self._docs.get(doc._.id)
+            if entry is not None and entry[0] is doc:
+                del self._docs[doc._.id]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+
+    def __len__(self):
+        return len(self._docs)
 
 
 class Annotation(Span):
     idx: int = None
-    cache: Dict[Type, Dict[str, Dict[int, List]]] = defaultdict(lambda: defaultdict(dict))
+    cache: AnnotationCache = AnnotationCache()
 
     @property
     def fqn(self):
@@ -144,17 +496,58 @@ class Annotation(Span):
 
     @classmethod
     def make(cls, doc: Doc, idx: int, start, end, label, *args, **kwargs):
-        if not doc._.id or not cls.cache[cls][doc._.id].get(idx, None):
-
-            span = doc._.char_span_relaxed(start, end)
-            span = cls(doc, span.start, span.end, label, *args, **kwargs)
-            span.idx = idx
-            logger.trace(f"creating {span.fqn}")
-            if doc._.id:
-                cls.cache[cls][doc._.id][idx] = span
-            else:
-                logger.trace('Id not set for doc, omit caching...')
-                return span
+        if not doc._.id:
+            logger.trace('Id not set for doc, omit caching...')
+            return cls._create(doc, idx, start, end, label, *args, **kwargs)
+        span = cls.cache.get(cls, doc, idx)
+        if span is None:
+            span = cls._create(doc, idx, start, end, label, *args, **kwargs)
+            cls.cache.put(cls, doc, idx, span)
         else:
-            logger.trace(f"{cls.cache[cls][doc._.id][idx]} is in cache!")
-        return cls.cache[cls][doc._.id][idx]
+            logger.trace(f"{span.fqn} is in cache!")
+        return span
+
+    @classmethod
+    def _create(cls, doc: Doc, idx: int, start, end, label, *args, **kwargs):
+        span = doc._.char_span_relaxed(start, end)
+        span = cls(doc, span.start, span.end, label, *args, **kwargs)
+        span.idx = idx
+        logger.trace(f"creating {span.fqn}")
+        return span
+
+
+class AnnotationView:
+    """
+    Lightweight, read-only view of one annotation of a document, without creating a span for it.
+
+    Exposes the character offsets and label of the annotation as stored. Subclasses define which :class:`Annotation`
+    :meth:`span` creates, on demand.
+
+    Args:
+        doc: Document the annotation belongs to.
+        idx: Index of the annotation in its layer.
+        start_char: Character offset the annotation starts at.
+        end_char: Character offset the annotation ends at.
+        label_: Label of the annotation.
+        meta: Any further information stored with the annotation.
+    """
+    __slots__ = ('doc', 'idx', 'start_char', 'end_char', 'label_', 'meta')
+    annotation: Type[Annotation] = Annotation
+
+    def __init__(self, doc: Doc, idx: int, start_char: int, end_char: int, label_: str, meta: Any = None):
+        self.doc = doc
+        self.idx = idx
+        self.start_char = start_char
+        self.end_char = end_char
+        self.label_ = label_
+        self.meta = meta
+
+    @property
+    def text(self) -> str:
+        return self.doc.text[self.start_char:self.end_char]
+
+    def span(self) -> Annotation:
+        return self.annotation.make(self.doc, self.idx)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.start_char}, {self.end_char}, {self.label_!r})"
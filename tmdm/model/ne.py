@@ -2,10 +2,11 @@ from typing import List, Optional
 from spacy.tokens import Doc, Token, Span
 from loguru import logger
 
-from tmdm.model.extensions import Annotation, extend
+from tmdm.model.extensions import Annotation, AnnotationView, extend, interval_index, invalidate_interval_index, \
+    token_membership, invalidate_token_membership
 
 
-@extend(Token, type='property', create_attribute=True, default=[])
+@extend(Token, type='property', create_attribute=False)
 def nes(self: Token):
     """
 
@@ -18,9 +19,10 @@ def nes(self: Token):
 
     """
     logger.debug(f"Retrieving ne annotations for token '{self}'")
-    logger.debug(f"Result is: '{self._._nes}'")
+    members = token_membership(self.doc, 'nes', self.doc._._nes)[self.i]
+    logger.debug(f"Result is: '{members}'")
     return [
-        NamedEntity.make(self.doc, i) for i in self._._nes
+        NamedEntity.make(self.doc, i) for i in members
     ]
 
 
@@ -31,14 +33,14 @@ def set_nes(self: Doc, nes):
         # logger.error("Cannot re-set tokens (yet)!")
         # raise NotImplementedError("Cannot re-set tokens (yet)!")
         self._._nes = []
-    for idx, (start, end, label) in enumerate(nes):
-        logger.trace(nes)
-        for token in self._.char_span_relaxed(start, end):
-            annotations = token._._nes
-            if idx not in annotations:
-                annotations.append(idx)
-
     self._._nes = nes
+    invalidate_interval_index(self, 'nes')
+    invalidate_token_membership(self, 'nes')
+    token_membership(self, 'nes', nes)
+
+
+def _index(doc: Doc):
+    return interval_index(doc, 'nes', doc._._nes)
 
 
 Span.set_extension('ne_meta', default=None, force=True)
@@ -70,10 +72,7 @@ def nes(self: Doc) -> List['NamedEntity']:
 def get_ne(self: Span) -> Optional['NamedEntity']:
     start = self[0].idx
     end = self[-1].idx + len(self[-1])
-    return next(
-        (NamedEntity.make(self.doc, i) for i, (s, e, _) in enumerate(self.doc._._nes) if start == s and end == e),
-        None
-    )
+    return next((NamedEntity.make(self.doc, i) for i in _index(self.doc).exact_matches(start, end)), None)
 
 
 @extend(Span)
@@ -86,9 +85,7 @@ def get_nes(self: Span):
     start = self[0].idx
     end = self[-1].idx + len(self[-1])
     logger.trace(f"start,end: {start},{end}")
-    return [
-        NamedEntity.make(self.doc, i) for i, (s, e, _) in enumerate(self.doc._._nes) if start <= s and end >= e
-    ]
+    return [NamedEntity.make(self.doc, i) for i in _index(self.doc).contained_in(start, end)]
 
 
 @extend(Span)
@@ -112,3 +109,22 @@ class NamedEntity(Annotation):
             span = super().make(doc, idx, start, end, label=label['label'])
             span._.ne_meta = label
             return span
+
+
+class NamedEntityView(AnnotationView):
+    __slots__ = ()
+    annotation = NamedEntity
+
+
+@extend(Doc, 'property', create_attribute=False)
+def ne_views(self: Doc) -> List[NamedEntityView]:
+    """
+    Views of the named entities of the document, for iterating over them without creating spans.
+
+    The meta of a view is the dict the entity was annotated with, if any, like `ne_meta` of a :class:`NamedEntity`.
+    """
+    return [
+        NamedEntityView(self, i, start, end, label['label'], label) if isinstance(label, dict)
+        else NamedEntityView(self, i, start, end, label, {})
+        for i, (start, end, label) in enumerate(self._._nes)
+    ]
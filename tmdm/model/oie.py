@@ -1,13 +1,12 @@
 from collections import defaultdict
-from operator import itemgetter
-from typing import List, Tuple, Dict, Iterable, Optional
+from typing import List, Tuple, Dict, Optional, Union
 
-from fastcache import clru_cache
 from loguru import logger
 from spacy.tokens import Token, Doc, Span
 
 from tmdm.classes import ERTuple
-from tmdm.model.extensions import Annotation, extend
+from tmdm.model.extensions import Annotation, AnnotationView, Adjacency, extend, memo_table, interval_index, \
+    invalidate_interval_index, token_membership, invalidate_token_membership
 
 
 # HAS SCIENCE GONE TOO FAR?
@@ -15,7 +14,7 @@ def _make(doc, i):
     return (Verb if doc._._oies.entities[i][2].startswith("V") else Argument).make(doc, i)
 
 
-@extend(Token, type='property', create_attribute=True, default=[])
+@extend(Token, type='property', create_attribute=False)
 def oies(self: Token):
     """
 
@@ -28,9 +27,10 @@ def oies(self: Token):
 
     """
     logger.debug(f"Retrieving ne annotations for token '{self}'")
-    logger.debug(f"Result is: '{self._._oies}'")
+    members = token_membership(self.doc, 'oies', _entities(self.doc))[self.i]
+    logger.debug(f"Result is: '{members}'")
     return [
-        _make(self.doc, i) for i in self._._oies
+        _make(self.doc, i) for i in members
     ]
 
 
@@ -40,14 +40,23 @@ def set_oies(self: Doc, oies):
         logger.error("Cannot re-set tokens (yet)!")
         raise NotImplementedError("Cannot re-set tokens (yet)!")
 
-    for idx, (start, end, label) in enumerate(tags):
-        logger.trace(f"oies:{tags}")
-        for token in self._.char_span_relaxed(start, end):
-            annotations = token._._oies
-            if idx not in annotations:
-                annotations.append(idx)
-
     self._._oies = ERTuple(*oies)
+    invalidate_interval_index(self, 'oies')
+    invalidate_token_membership(self, 'oies')
+    token_membership(self, 'oies', self._._oies.entities)
+    _build_adjacency(self)
+
+
+def _entities(doc: Doc) -> List[Tuple[int, int, str]]:
+    return doc._._oies.entities if doc._._oies else []
+
+
+def _index(doc: Doc):
+    return interval_index(doc, 'oies', doc._._oies.entities)
+
+
+def _label(doc: Doc, idx: int) -> str:
+    return doc._._oies.entities[idx][2]
 
 
 @extend(Doc, 'property', create_attribute=True, default=[], setter=set_oies)
@@ -59,16 +68,29 @@ def oies(self: Doc) -> List['Verb']:
     return [Verb.make(self.doc, i) for i, (_, _, label) in enumerate(tags) if label == 'VERB' or label == "V"]
 
 
-@clru_cache(maxsize=100000)
-def _v2a(self: Doc, idx) -> Iterable[int]:
-    arg_ids = [(arg_idx, label) for verb_idx, arg_idx, label in self._._oies.relations if verb_idx == idx]
-    key = itemgetter(0)
-    return [arg_idx for arg_idx, _ in sorted(arg_ids, key=key)]
+def _build_adjacency(doc: Doc) -> Dict[str, Adjacency]:
+    entities, relations = doc._._oies
+    adjacency = memo_table(doc, 'oie_adjacency')
+    # arguments of a verb in entity order, verbs of an argument in relation order
+    adjacency['v2a'] = Adjacency((r[0] for r in relations), (r[1] for r in relations), len(entities),
+                                 sort_targets=True)
+    adjacency['a2v'] = Adjacency((r[1] for r in relations), (r[0] for r in relations), len(entities))
+    return adjacency
+
+
+def _adjacency(doc: Doc) -> Dict[str, Adjacency]:
+    adjacency = memo_table(doc, 'oie_adjacency')
+    if not adjacency:
+        adjacency = _build_adjacency(doc)
+    return adjacency
+
 
+def _v2a(self: Doc, idx) -> List[int]:
+    return _adjacency(self)['v2a'][idx]
 
-@clru_cache(maxsize=100000)
-def _a2v(self: Doc, idx) -> Iterable[int]:
-    return [verb_idx for verb_idx, arg_idx, _ in self._._oies.relations if arg_idx == idx]
+
+def _a2v(self: Doc, idx) -> List[int]:
+    return _adjacency(self)['a2v'][idx]
 
 
 class Verb(Annotation):
@@ -130,8 +152,8 @@ def get_verb(self: Span) -> Optional['Verb']:
     start = self[0].idx
     end = self[-1].idx + len(self[-1])
     return next(
-        (Verb.make(self.doc, i) for i, (s, e, l) in enumerate(self.doc._._oies.entities)
-         if start == s and end == e and l.startswith("V")),
+        (Verb.make(self.doc, i) for i in _index(self.doc).exact_matches(start, end)
+         if _label(self.doc, i).startswith("V")),
         None
     )
 
@@ -146,8 +168,8 @@ def get_argument(self: Span) -> Optional['Argument']:
     start = self[0].idx
     end = self[-1].idx + len(self[-1])
     return next(
-        (Argument.make(self.doc, i) for i, (s, e, l) in enumerate(self.doc._._oies.entities)
-         if start == s and end == e and l.startswith("ARG")),
+        (Argument.make(self.doc, i) for i in _index(self.doc).exact_matches(start, end)
+         if _label(self.doc, i).startswith("ARG")),
         None
     )
 
@@ -163,8 +185,7 @@ def get_verbs(self: Span):
     end = self[-1].idx + len(self[-1])
     logger.trace(f"start,end: {start},{end}")
     return [
-        Verb.make(self.doc, i) for i, (s, e, l) in enumerate(self.doc._._oies.entities)
-        if start <= s and end >= e and l.startswith("V")
+        Verb.make(self.doc, i) for i in _index(self.doc).contained_in(start, end) if _label(self.doc, i).startswith("V")
     ]
 
 
@@ -178,8 +199,8 @@ def get_arguments(self: Span) -> List['Argument']:
     start = self[0].idx
     end = self[-1].idx + len(self[-1])
     return [
-        Argument.make(self.doc, i) for i, (s, e, l) in enumerate(self.doc._._oies.entities)
-        if start <= s and end >= e and l.startswith("ARG")
+        Argument.make(self.doc, i) for i in _index(self.doc).contained_in(start, end)
+        if _label(self.doc, i).startswith("ARG")
     ]
 
 
@@ -205,3 +226,22 @@ class Argument(Annotation):
         argument._verbs = verb_ids
         argument.order = label
         return argument
+
+
+class OieView(AnnotationView):
+    __slots__ = ()
+
+    @property
+    def is_verb(self) -> bool:
+        return self.label_.startswith("V")
+
+    def span(self) -> Union[Verb, Argument]:
+        return _make(self.doc, self.idx)
+
+
+@extend(Doc, 'property', create_attribute=False)
+def oie_views(self: Doc) -> List[OieView]:
+    """
+    Views of the verbs and arguments of the document, for iterating over them without creating spans.
+    """
+    return [OieView(self, i, start, end, label) for i, (start, end, label) in enumerate(_entities(self))]
@@ -2,7 +2,6 @@ from collections import defaultdict
 from operator import itemgetter
 from typing import List, Tuple, Dict, Iterable, Optional
 
-from fastcache import clru_cache
 from loguru import logger
 from spacy.tokens import Token, Doc, Span
 
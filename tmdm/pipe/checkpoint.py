@@ -0,0 +1,39 @@
+import os
+from typing import Iterable, Set, Any
+
+from loguru import logger
+from spacy.tokens import Doc
+
+from tmdm.util import batch_by_budget
+from tmdm.writers.docbin import DocBinWriter, read_docbin_ids
+
+
+class Checkpoint:
+    """
+    Records the output of a pipeline run, so that an interrupted run can be resumed.
+
+    Annotated docs are appended to a :class:`DocBinWriter` file in chunks of `every` docs before they are handed on.
+    Passed to :meth:`Pipeline.pipe`, inputs whose ids are already in the file are skipped. This requires ids that are
+    stable across runs, i.e. ids from the getter or content ids.
+
+    Args:
+        path: File to record the annotated docs in. Read them back with :func:`tmdm.writers.docbin.read_docbin`.
+        every: Number of docs per recorded chunk.
+    """
+
+    def __init__(self, path: str, every: int = 1000):
+        self.path = path
+        self.every = every
+        self.writer = DocBinWriter(path)
+
+    def completed(self) -> Set[Any]:
+        if not os.path.exists(self.path):
+            return set()
+        completed = set(read_docbin_ids(self.path))
+        logger.info(f"Resuming, {len(completed)} docs already completed in {self.path}.")
+        return completed
+
+    def record(self, docs: Iterable[Doc]) -> Iterable[Doc]:
+        for chunk in batch_by_budget(docs, max_items=self.every):
+            self.writer(chunk)
+            yield from chunk
@@ -1,22 +1,38 @@
-import itertools
-from typing import Iterable, Any, List, Callable, Union, Collection
+from functools import partial
+from typing import Iterable, Any, List, Callable, Union, Collection, Tuple, Container, TYPE_CHECKING
 from uuid import uuid4
 
 from loguru import logger
 from spacy.tokens import Doc
 
 from tmdm.classes import Provider
+from tmdm.model.extensions import Annotation
+from tmdm.pipe.staged import run_staged
+from tmdm.util import batch_by_budget, content_hash, serialisable_id
+
+if TYPE_CHECKING:
+    # imported at runtime, it would be circular through tmdm.writers.docbin
+    from tmdm.pipe.checkpoint import Checkpoint
 
 
 class Pipeline:
-    def __init__(self, nlp, pipes=None, getter=None, generate_ids=True):
+    def __init__(self, nlp, pipes=None, getter=None, generate_ids=True, content_ids=False):
         self.pipes: List[PipeElement] = pipes or []
         self.nlp = nlp
         self.getter = getter
         self.generate_ids = generate_ids
+        self.content_ids = content_ids
         if not self.generate_ids and not getter:
             raise ValueError("Need IDs from somewhere!")
 
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the preprocessing configuration: spaCy model, its version and its components.
+        """
+        meta = self.nlp.meta
+        return f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}:{','.join(self.nlp.pipe_names)}"
+
     def add_pipe(self, pipe):
         self.pipes.append(pipe)
 
@@ -28,42 +44,108 @@ class Pipeline:
             self.pipes.remove(to_remove)
             return to_remove
 
-    def preprocess(self, data: Any) -> Doc:
+    def get_id_and_text(self, data: Any) -> Tuple[Any, str]:
         if not self.generate_ids:
             uuid, text = self.getter(data)
         else:
-            uuid = uuid4()
             text = self.getter(data) if self.getter else data
+            # the same text preprocessed the same way gets the same id across runs
+            uuid = content_hash(text, self.fingerprint) if self.content_ids else uuid4()
+        return uuid, text
+
+    def preprocess(self, data: Any) -> Doc:
+        uuid, text = self.get_id_and_text(data)
         doc = self.nlp(text)
         doc._.id = uuid
         return doc
 
+    def preprocess_stream(self, data_stream: Iterable[Any], batch_size=64, n_process=1,
+                          skip_ids: Container = ()) -> Iterable[Doc]:
+        """
+        Tokenises a stream of inputs in a single pass through spaCy's ``nlp.pipe``.
+
+        The ids are handed through spaCy as context and attached to the docs afterwards.
+
+        Args:
+            data_stream: Inputs as accepted by the configured getter.
+            batch_size: Batch size for ``nlp.pipe``.
+            n_process: Number of processes for ``nlp.pipe``.
+            skip_ids: Ids of inputs to leave out, as serialised (see :func:`tmdm.util.serialisable_id`).
+
+        Returns:
+            Lazy stream of preprocessed docs, in input order.
+
+        """
+        texts_with_ids = (
+            (text, uuid) for uuid, text in map(self.get_id_and_text, data_stream)
+            if serialisable_id(uuid) not in skip_ids
+        )
+        for doc, uuid in self.nlp.pipe(texts_with_ids, as_tuples=True, batch_size=batch_size, n_process=n_process):
+            doc._.id = uuid
+            yield doc
+
     def __call__(self, data: Any) -> Doc:
         doc = self.preprocess(data)
         for p in self.pipes:
             p(doc)
         return doc
 
-    def pipe(self, data_stream: Iterable[Any], batch_size=8) -> Iterable[Doc]:
-        data_stream = iter(data_stream)
-        chunk = itertools.islice(data_stream, batch_size)
-        chunk = list(chunk)
-        while chunk:
-            chunk = list([self.preprocess(d) for d in chunk])
+    def pipe(self, data_stream: Iterable[Any], batch_size=8, nlp_batch_size=None, n_process=1,
+             overlap=False, queue_size=2, checkpoint: 'Checkpoint' = None) -> Iterable[Doc]:
+        """
+        Annotates a stream of inputs.
+
+        Every pipe gets the docs in batches of its own `batch_size` and/or `max_tokens` if it declares them,
+        otherwise in batches of `batch_size` docs.
+
+        Args:
+            data_stream: Inputs as accepted by the configured getter.
+            batch_size: Default number of docs per batch for pipes that don't declare their own.
+            nlp_batch_size: Batch size for spaCy's ``nlp.pipe``, defaults to `batch_size`.
+            n_process: Number of processes for spaCy's ``nlp.pipe``.
+            overlap: Whether to run each pipe on its own thread, so that the pipes work on different batches at the
+                same time.
+            queue_size: Number of batches waiting in front of each pipe, if `overlap` is set.
+            checkpoint: :class:`tmdm.pipe.checkpoint.Checkpoint` to record the annotated docs in. Inputs it has
+                already recorded are skipped and not yielded again.
+
+        Returns:
+            Lazy stream of annotated docs, in input order. Cached annotation spans of a doc are released once the
+            next doc is requested.
+
+        """
+        skip_ids = ()
+        if checkpoint:
+            if self.generate_ids and not self.content_ids:
+                raise ValueError("Cannot resume with random ids, use ids from the getter or content ids!")
+            skip_ids = checkpoint.completed()
+        docs = self.preprocess_stream(data_stream, batch_size=nlp_batch_size or batch_size, n_process=n_process,
+                                      skip_ids=skip_ids)
+        if overlap:
+            chunks = batch_by_budget(docs, max_items=batch_size)
+            chunkers = [partial(pipe.chunks, default_batch_size=batch_size) for pipe in self.pipes]
+            chunks = run_staged(chunks, [pipe.pipe for pipe in self.pipes], queue_size=queue_size, chunkers=chunkers)
+            docs = (doc for chunk in chunks for doc in chunk)
+        else:
             for pipe in self.pipes:
-                pipe.pipe(chunk)
-            for doc in chunk:
-                yield doc
-            chunk = itertools.islice(data_stream, batch_size)
-            chunk = list(chunk)
+                docs = pipe.pipe_stream(docs, default_batch_size=batch_size)
+        if checkpoint:
+            docs = checkpoint.record(docs)
+        for doc in docs:
+            yield doc
+            # the consumer is done with the doc, its annotations will be re-created on demand
+            Annotation.cache.release(doc)
 
 
 class PipeElement:
-    def __init__(self, name, field, provider: Union[Provider, Callable[[Collection[Doc], ], Any]], reset_cache=False):
+    def __init__(self, name, field, provider: Union[Provider, Callable[[Collection[Doc], ], Any]], reset_cache=False,
+                 batch_size: int = None, max_tokens: int = None):
         self.name = name
         self.provider = provider
         self.field = field
         self.reset_cache = reset_cache
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
 
     def __call__(self, doc: Doc):
         try:
@@ -86,3 +168,24 @@ class PipeElement:
                 setattr(doc._, self.field, annotations)
         if self.reset_cache and self.field:
             for ann in getattr(doc._, self.field): ann.cache.clear()
+
+    def chunks(self, docs: Iterable[Doc], default_batch_size: int = 8) -> Iterable[List[Doc]]:
+        """
+        Cuts a stream of docs into the batches this pipe wants to process.
+
+        Args:
+            docs: Stream of docs.
+            default_batch_size: Number of docs per batch if neither `batch_size` nor `max_tokens` is set.
+
+        Returns:
+            Stream of batches of docs, limited by `batch_size` docs and/or `max_tokens` tokens.
+
+        """
+        if self.batch_size or self.max_tokens:
+            return batch_by_budget(docs, max_items=self.batch_size, max_tokens=self.max_tokens)
+        return batch_by_budget(docs, max_items=default_batch_size)
+
+    def pipe_stream(self, docs: Iterable[Doc], default_batch_size: int = 8) -> Iterable[Doc]:
+        for chunk in self.chunks(docs, default_batch_size):
+            self.pipe(chunk)
+            yield from chunk
@@ -0,0 +1,66 @@
+import itertools
+import multiprocessing
+from collections import deque
+from typing import Callable, Iterable, Any, List, Optional
+
+from loguru import logger
+from spacy.tokens import Doc
+from spacy.vocab import Vocab
+
+from tmdm.pipe.pipe import Pipeline
+from tmdm.writers.docbin import docs_to_bytes, docs_from_bytes
+
+_worker_pipeline: Optional[Pipeline] = None
+
+
+def _process_chunk(factory: Callable[[], Pipeline], chunk: List[Any], batch_size: int) -> bytes:
+    # built on first use rather than in a pool initializer, so that failing to build it reaches the caller
+    global _worker_pipeline
+    if _worker_pipeline is None:
+        logger.debug(f"Building pipeline in worker {multiprocessing.current_process().name}")
+        _worker_pipeline = factory()
+    # docs are sent back without their vocab, which would be pickled with every chunk otherwise
+    return docs_to_bytes(list(_worker_pipeline.pipe(chunk, batch_size=batch_size)))
+
+
+class ShardedPipeline:
+    """
+    Runs a :class:`Pipeline` on a pool of worker processes.
+
+    Every worker builds its own pipeline (spaCy model and providers) once, by calling `factory`. The input stream is
+    cut into shards of `chunk_size` inputs which are processed by the workers; the annotated docs are yielded in
+    input order. Workers send the docs back serialised (see :func:`tmdm.writers.docbin.docs_to_bytes`), and they are
+    restored with `vocab`. Ids keep their type if they are strings, integers or UUIDs, other ids come back as their
+    string.
+
+    Args:
+        factory: Picklable callable that returns a fully configured :class:`Pipeline`.
+        n_workers: Number of worker processes. Defaults to the number of CPUs.
+        chunk_size: Number of inputs sent to a worker at once.
+        max_pending: Maximum number of shards in flight. Defaults to twice the number of workers.
+        start_method: Multiprocessing start method, e.g. 'fork' or 'spawn'.
+        vocab: Vocab to restore the docs with, e.g. the vocab of the spaCy model the workers use, for its lexical
+            attributes and vectors. Defaults to an empty vocab.
+    """
+
+    def __init__(self, factory: Callable[[], Pipeline], n_workers: int = None, chunk_size: int = 64,
+                 max_pending: int = None, start_method: str = None, vocab: Vocab = None):
+        self.factory = factory
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 2 * self.n_workers
+        self.start_method = start_method
+        self.vocab = vocab or Vocab()
+
+    def pipe(self, data_stream: Iterable[Any], batch_size=8) -> Iterable[Doc]:
+        data_stream = iter(data_stream)
+        chunks = iter(lambda: list(itertools.islice(data_stream, self.chunk_size)), [])
+        context = multiprocessing.get_context(self.start_method)
+        with context.Pool(self.n_workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_process_chunk, (self.factory, chunk, batch_size)))
+                if len(pending) >= self.max_pending:
+                    yield from docs_from_bytes(pending.popleft().get(), self.vocab)
+            while pending:
+                yield from docs_from_bytes(pending.popleft().get(), self.vocab)
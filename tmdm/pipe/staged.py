@@ -0,0 +1,110 @@
+import queue
+import threading
+from typing import Iterable, List, Callable, Any, Optional
+
+from loguru import logger
+from spacy.tokens import Doc
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _feed(chunks: Iterable[List[Doc]], out_queue: queue.Queue, stop: threading.Event):
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                return
+            _put(out_queue, chunk, stop)
+    except BaseException as e:
+        _put(out_queue, _Failure(e), stop)
+        return
+    _put(out_queue, _DONE, stop)
+
+
+def _work(stage: Callable[[List[Doc]], Any], chunker: Optional[Callable[[Iterable[Doc]], Iterable[List[Doc]]]],
+          in_queue: queue.Queue, out_queue: queue.Queue, stop: threading.Event):
+    end = []
+
+    def incoming():
+        while True:
+            chunk = _get(in_queue, stop)
+            if chunk is _DONE or isinstance(chunk, _Failure):
+                end.append(chunk)
+                return
+            yield chunk
+
+    chunks = chunker(doc for chunk in incoming() for doc in chunk) if chunker else incoming()
+    try:
+        for chunk in chunks:
+            stage(chunk)
+            _put(out_queue, chunk, stop)
+    except BaseException as e:
+        _put(out_queue, _Failure(e), stop)
+        return
+    _put(out_queue, end[0] if end else _DONE, stop)
+
+
+def run_staged(chunks: Iterable[List[Doc]], stages: List[Callable[[List[Doc]], Any]], queue_size: int = 2,
+               chunkers: List[Callable[[Iterable[Doc]], Iterable[List[Doc]]]] = None) -> Iterable[List[Doc]]:
+    """
+    Runs every stage on its own thread, connected by bounded queues.
+
+    While one chunk is in stage `i`, the next chunk can already be in stage `i - 1`, so that the stages overlap.
+    Chunks are yielded in input order once they went through all stages. An exception raised in any of the stages
+    is re-raised in the consuming thread.
+
+    Args:
+        chunks: Stream of chunks of docs. Consumed on its own thread.
+        stages: Callables that annotate a chunk of docs in place, e.g. :meth:`PipeElement.pipe`.
+        queue_size: Maximum number of chunks waiting in front of each stage.
+        chunkers: Optional callables, one per stage, that re-chunk the docs before they enter that stage.
+
+    Returns:
+        The chunks, annotated by all stages.
+
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_feed, args=(chunks, queues[0], stop), daemon=True)]
+    threads.extend(
+        threading.Thread(target=_work, args=(stage, chunkers[i] if chunkers else None, queues[i], queues[i + 1], stop),
+                         daemon=True)
+        for i, stage in enumerate(stages)
+    )
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            chunk = queues[-1].get()
+            if chunk is _DONE:
+                break
+            if isinstance(chunk, _Failure):
+                raise chunk.exception
+            yield chunk
+    finally:
+        logger.trace("Shutting down stages...")
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,251 @@
+import mmap
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Iterable, Tuple, List, Optional, Iterator, Union
+
+import numpy as np
+import srsly
+from loguru import logger
+from srsly import ujson as json
+
+INDEX_SUFFIX = '.idx.npy'
+
+
+def index_path(path: str) -> str:
+    return path + INDEX_SUFFIX
+
+
+def write_index(path: str, entries: List[Tuple[str, int, int]]):
+    """
+    Writes the id-to-offset index of a store next to it.
+
+    The index is a key-sorted NumPy structured array of `(key, offset, length)` records, so that it can be opened
+    memory-mapped and searched without loading it. If a key occurs more than once, the last entry wins.
+
+    Args:
+        path: Path of the store the index belongs to.
+        entries: `(key, offset, length)` of every record, in file order.
+
+    """
+    keys = [str(key).encode('utf-8') for key, _, _ in entries]
+    width = max((len(key) for key in keys), default=1) or 1
+    index = np.empty(len(entries), dtype=[('key', f'S{width}'), ('offset', '<u8'), ('length', '<u8')])
+    index['key'] = keys
+    index['offset'] = [offset for _, offset, _ in entries]
+    index['length'] = [length for _, _, length in entries]
+    index = index[np.argsort(index['key'], kind='stable')]
+    if len(index):
+        index = index[np.append(index['key'][1:] != index['key'][:-1], True)]
+    np.save(index_path(path), index)
+
+
+class IndexedStore(Mapping, ABC):
+    """
+    Read-only mapping from ids to records of a file, decoding records only when they are looked up.
+
+    The file is memory-mapped and records are located through the index written by :func:`write_index`. Subclasses
+    define how a record is decoded.
+
+    Args:
+        path: Path of the store. Its index is expected at `path + '.idx.npy'`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        self._data = (mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                      if os.path.getsize(self.path) else b'')
+        self._index = np.load(index_path(self.path), mmap_mode='r')
+
+    @abstractmethod
+    def decode(self, record: bytes) -> Any:
+        ...
+
+    def _locate(self, key: Any) -> Optional[Tuple[int, int]]:
+        keys = self._index['key']
+        encoded = str(key).encode('utf-8')
+        if not len(keys) or len(encoded) > keys.dtype.itemsize:
+            return None
+        i = int(np.searchsorted(keys, encoded))
+        if i < len(keys) and keys[i] == encoded:
+            return int(self._index['offset'][i]), int(self._index['length'][i])
+        return None
+
+    def __getitem__(self, key: Any) -> Any:
+        location = self._locate(key)
+        if location is None:
+            raise KeyError(key)
+        offset, length = location
+        return self.decode(self._data[offset:offset + length])
+
+    def __contains__(self, key: Any) -> bool:
+        return self._locate(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (key.decode('utf-8') for key in self._index['key'])
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._open()
+
+
+class MsgpackStore(IndexedStore):
+    """
+    Store of msgpack-encoded records, concatenated into one file.
+    """
+
+    def decode(self, record: bytes) -> Any:
+        return srsly.msgpack_loads(record)
+
+    @classmethod
+    def write(cls, path: str, items: Iterable[Tuple[Any, Any]]) -> 'MsgpackStore':
+        """
+        Writes records and their index, streaming.
+
+        Args:
+            path: Path to write the store to.
+            items: `(id, record)` pairs.
+
+        Returns:
+            The store, opened.
+
+        """
+        entries = []
+        with open(path, 'wb') as f:
+            for key, value in items:
+                record = srsly.msgpack_dumps(value)
+                entries.append((key, f.tell(), len(record)))
+                f.write(record)
+        write_index(path, entries)
+        return cls(path)
+
+
+class JsonlStore(IndexedStore):
+    """
+    Store over a jsonl file, one record per line, keyed by a field of the records.
+
+    The index is built by streaming over the file once and persisted next to it; it is rebuilt if the file is newer
+    than its index.
+
+    Args:
+        path: Path of the jsonl file.
+        id_field: Field of the records holding their id.
+    """
+
+    def __init__(self, path: str, id_field: str = 'id'):
+        self.id_field = id_field
+        if not os.path.exists(index_path(path)) or os.path.getmtime(index_path(path)) < os.path.getmtime(path):
+            self.build_index(path, id_field)
+        super().__init__(path)
+
+    def decode(self, record: bytes) -> Any:
+        return json.loads(record)
+
+    @staticmethod
+    def build_index(path: str, id_field: str = 'id'):
+        logger.info(f"Indexing '{path}'...")
+        entries = []
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    entries.append((json.loads(line)[id_field], offset, len(line)))
+                offset += len(line)
+        write_index(path, entries)
+
+    def __getstate__(self):
+        return {'path': self.path, 'id_field': self.id_field}
+
+    def __setstate__(self, state):
+        self.id_field = state['id_field']
+        super().__setstate__(state)
+
+
+class SqliteStore(MutableMapping):
+    """
+    Persistent, writable mapping from ids to msgpack-encoded records, backed by an SQLite table.
+
+    Can be shared between threads; writes of one :meth:`update` are committed together.
+
+    Args:
+        path: Path of the SQLite database, created if it doesn't exist.
+        table: Name of the table holding the records.
+    """
+
+    def __init__(self, path: str, table: str = 'records'):
+        self.path = path
+        self.table = table
+        self._open()
+
+    def _open(self):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB)")
+
+    def __getitem__(self, key: Any) -> Any:
+        with self._lock:
+            row = self._connection.execute(f"SELECT value FROM {self.table} WHERE key = ?", (str(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return srsly.msgpack_loads(row[0])
+
+    def __setitem__(self, key: Any, value: Any):
+        self.update([(key, value)])
+
+    def __delitem__(self, key: Any):
+        with self._lock, self._connection:
+            deleted = self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (str(key),)).rowcount
+        if not deleted:
+            raise KeyError(key)
+
+    def update(self, items: Union[Mapping, Iterable[Tuple[Any, Any]]] = (), **kwargs):
+        items = list(items.items() if isinstance(items, Mapping) else items) + list(kwargs.items())
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+                ((str(key), srsly.msgpack_dumps(value)) for key, value in items)
+            )
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            return self._connection.execute(
+                f"SELECT 1 FROM {self.table} WHERE key = ?", (str(key),)
+            ).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            keys = [key for key, in self._connection.execute(f"SELECT key FROM {self.table}")]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def __getstate__(self):
+        return {'path': self.path, 'table': self.table}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.table = state['table']
+        self._open()
@@ -9,6 +9,7 @@ from typing import Callable, Any, Dict, Optional, List
 from transformers import Pipeline, pipeline
 
 from tmdm.classes import CharOffsetAnnotation, Provider
+from tmdm.util import predict_bucketed
 
 default = object()
 
@@ -25,6 +26,7 @@ class OnlineProvider(Provider):
             preprocessor: Optional[Callable[[Doc], Instance]] = default,
             converter: Callable[[Doc, Any], CharOffsetAnnotation] = None,
             cuda=-1,
+            max_tokens: int = None,
     ):
         super().__init__()
 
@@ -35,6 +37,7 @@ class OnlineProvider(Provider):
         self.path_or_name = path_or_name
         self.path_or_name_tokenizer = path_or_name_tokenizer or self.path_or_name
         self.cuda = cuda
+        self.max_tokens = max_tokens
         self.load()
 
     @property
@@ -53,13 +56,25 @@ class OnlineProvider(Provider):
     def _preprocess(self, doc: Doc):
         return [str(sent) for sent in doc.sents]
 
+    def _length(self, instance) -> int:
+        # batches are padded to the longest input in subword tokens of the model, not in words
+        if isinstance(instance, str):
+            return len(self.pipeline.tokenizer(instance)['input_ids'])
+        return len(instance)
+
+    def _predict_batch(self, instances: List[Any]) -> List[Any]:
+        return self.pipeline(instances, batch_size=len(instances))
+
     @overrides
     def annotate_batch(self, docs: List[Doc]) -> List[CharOffsetAnnotation]:
         logger.trace("Entering annotate batch...")
         instances = [self.preprocess(doc) for doc in docs] if self.preprocess else docs
         # try:
         flat_instances = [i for l in instances for i in l]
-        result = self.pipeline(flat_instances)
+        if self.max_tokens:
+            result = predict_bucketed(flat_instances, self._predict_batch, self.max_tokens, length=self._length)
+        else:
+            result = self.pipeline(flat_instances)
         logger.trace(f"Result: {result}")
         # except Exception as e:
         #    logger.error(str(e))
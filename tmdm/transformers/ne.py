@@ -6,7 +6,7 @@ from dateutil.parser import parse
 from tmdm.classes import CharOffsetAnnotation
 from tmdm.pipe.pipe import PipeElement
 from tmdm.transformers.common import OnlineProvider
-from tmdm.util import get_offsets_from_sentences
+from tmdm.util import get_offsets_from_sentences, predict_bucketed
 from transformers.pipelines import pipeline
 from flair.data import Sentence
 from flair.models import SequenceTagger
@@ -69,7 +69,10 @@ class OnlineNerProvider(OnlineProvider):
             logger.debug("Everything is empty!")
             return [[] for _ in docs]
         logger.debug(flat_instances)
-        result = self.pipeline(flat_instances)
+        if self.max_tokens:
+            result = predict_bucketed(flat_instances, self._predict_batch, self.max_tokens, length=self._length)
+        else:
+            result = self.pipeline(flat_instances)
         if not result:
             logger.debug("No named entities recognized!")
             return [[] for _ in docs]
@@ -100,8 +103,9 @@ class OnlineNerProvider(OnlineProvider):
         return ret
 
 
-def get_ne_pipe(model: str = None, tokenizer: str = None, cuda=-1, with_date=False):
+def get_ne_pipe(model: str = None, tokenizer: str = None, cuda=-1, with_date=False, max_tokens: int = None):
     return PipeElement(name='ner', field='nes',
                        provider=OnlineNerProvider(task="ner", path_or_name=model,
                                                   path_or_name_tokenizer=tokenizer,
-                                                  converter=convert, cuda=cuda, with_date=with_date))
\ No newline at end of file
+                                                  converter=convert, cuda=cuda, with_date=with_date,
+                                                  max_tokens=max_tokens))
\ No newline at end of file
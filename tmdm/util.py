@@ -1,22 +1,26 @@
+import hashlib
 import string
 
-import handystuff.loaders
-
 import tmdm
 # from scispacy.custom_sentence_segmenter import combined_rule_sentence_segmenter
 from spacy.tokens import Doc
 from srsly import msgpack
 from srsly import ujson as json
 from srsly import cloudpickle as pickle
-from typing import List, Iterable
+from typing import List, Iterable, Callable, Any, Optional, Mapping
 
 from loguru import logger
 
 from typing import Tuple
 
+from tmdm.align import Aligner
 from tmdm.classes import CharOffsetAnnotation
+from tmdm.stores import MsgpackStore, JsonlStore
 
-ACCEPTED_FORMATS = ('mpk', 'json', 'pkl', 'jsonl')
+# 'mpkx' is an indexed msgpack store (see tmdm.stores), read lazily from a memory-mapped file
+ACCEPTED_FORMATS = ('mpk', 'json', 'pkl', 'jsonl', 'mpkx')
+# 'jsonl' files are only read
+SAVE_FORMATS = ('mpk', 'json', 'pkl', 'mpkx')
 
 
 def _check_fmt(path, format=None):
@@ -31,8 +35,24 @@ def _check_fmt(path, format=None):
     return format
 
 
-def save_file(file, path: str, format: str = None):
+def save_format(path: str, format: str = None) -> str:
+    """
+    Format :func:`save_file` would write a file in, inferred from its path by default. Raises a ValueError if files
+    can't be written in the format.
+    """
     format = _check_fmt(path, format)
+    if format not in SAVE_FORMATS:
+        raise ValueError(f"Cannot save '{format}' files, only formats from [{SAVE_FORMATS}] are supported!")
+    return format
+
+
+def save_file(file, path: str, format: str = None):
+    """
+    Saves a file in one of the accepted formats, except 'jsonl'.
+
+    'mpkx' files are written streaming, from a mapping or from an iterable of `(id, record)` pairs.
+    """
+    format = save_format(path, format)
     if format == 'mpk':
         with open(path, "wb+") as f:
             msgpack.dump(file, f)
@@ -42,21 +62,59 @@ def save_file(file, path: str, format: str = None):
     elif format == "pkl":
         with open(path, 'wb+') as f:
             pickle.dump(file, f)
+    elif format == 'mpkx':
+        MsgpackStore.write(path, file.items() if isinstance(file, Mapping) else file)
+
 
+def load_file(path: str, format: str = None, id_field: str = 'id'):
+    """
+    Loads a file in one of the accepted formats.
 
-def load_file(path: str, format: str = None):
+    'jsonl' and 'mpkx' files are not read into memory but opened as read-only mappings (see :mod:`tmdm.stores`) that
+    decode records on access. Records of 'jsonl' files are keyed by their `id_field`.
+    """
     format = _check_fmt(path, format)
     if format == 'mpk':
         with open(path, "rb") as f:
             return msgpack.load(f)
     elif format == 'jsonl':
-        return handystuff.loaders.load_jsonl(path)
+        return JsonlStore(path, id_field=id_field)
     elif format == "json":
         with open(path, 'r') as f:
             return json.load(f)
     elif format == "pkl":
         with open(path, 'rb') as f:
             return pickle.load(f)
+    elif format == 'mpkx':
+        return MsgpackStore(path)
+
+
+def content_hash(text: str, *salt: str) -> str:
+    """
+    Hashes a text, optionally together with some salt (e.g. a configuration), into a short hex digest.
+
+    Args:
+        text: Text to hash.
+        *salt: Further strings to take into account.
+
+    Returns:
+        32 character hex digest.
+
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in salt:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def serialisable_id(doc_id: Any) -> Any:
+    """
+    Id of a doc as it is serialised, e.g. by :class:`tmdm.writers.docbin.DocBinWriter`: strings and integers as they
+    are, other ids (such as UUIDs or tuples) as their string.
+    """
+    return doc_id if doc_id is None or isinstance(doc_id, (str, int)) else str(doc_id)
 
 
 def as_printable(text):
@@ -64,64 +122,26 @@ def as_printable(text):
 
 
 def get_offsets(text: str, annotation: Iterable[Tuple[str, str]], init_offset=0, return_last_match=False):
-    result = []
-    offset = 0
-    text = text.lower()
+    """
+    Converts BIO-labelled tokens of a text to labelled character offsets (see :class:`tmdm.align.Aligner`).
 
-    for token, label in annotation:
-        try:
-            start = text[offset:].index(token.lower()) + offset
-            end = start + len(token)
-            logger.trace(f"searching for '{token}' ({label}) in '{text[offset:offset + end + 20]} [...]'")
-            logger.trace(f'text[{start}:{end}]: \'{text[start:end]}\'')
-
-        except ValueError:
-            # raise NotImplementedError()
-            logger.trace(f"{token} not in {text[offset:offset + 20]}!")
-            printable_text = as_printable(text[offset:])
-            try:
-                matched_index = printable_text.index(token.lower())
-                start = matched_index + offset
-                matched_string = printable_text[matched_index:matched_index + len(token)]
-                char_iter = iter(text[start:])
-                diff = 0
-                logger.trace(f"Matched {matched_string}")
-                for t in matched_string:
-                    original_char = next(char_iter)
-                    while t != original_char:
-                        original_char = next(char_iter)
-                        diff += 1
-
-                logger.trace(f"diff is {diff}")
-                end = start + len(token) + diff
-                logger.trace(f"searching for '{token}' ({label}) in '{printable_text[:offset + end + 20]} [...]'")
-                logger.trace(f'text[{start}:{end}]: \'{text[start:end]}\'')
-            except ValueError:
-                logger.trace(f"{token} not in {printable_text[:offset + len(token)]}!")
-                raise NotImplementedError
-
-        if not label == "O":
-            tag, category = label.split('-')
-            if tag == "B":
-                result.append((start + init_offset, end + init_offset, category))
-            elif tag == "I":
-                old_start, *rest = result[-1]
-                result[-1] = (old_start, end + init_offset, category)
-        offset = end
+    Tokens that can't be found in the text are skipped with a warning.
+    """
+    alignment = Aligner(text).align(annotation)
+    if alignment.unaligned:
+        logger.warning(f"Could not align {len(alignment.unaligned)} tokens to text '{text[:20]}[...]', skipping them.")
+    result = [(start + init_offset, end + init_offset, category) for start, end, category in alignment.entities]
     if return_last_match:
-        return result, offset + init_offset
+        return result, alignment.end + init_offset
     else:
         return result
 
 
 def get_offsets_from_sentences(text: str, annotation: Iterable[Iterable[Tuple[str, str]]]):
-    offset = 0
-    result = []
-    for sent in annotation:
-        logger.trace(text[offset:])
-        sent_result, offset = get_offsets(text[offset:], sent, init_offset=offset, return_last_match=True)
-        result.extend(sent_result)
-    return result
+    alignment = Aligner(text).align_sentences(annotation)
+    if alignment.unaligned:
+        logger.warning(f"Could not align {len(alignment.unaligned)} tokens to text '{text[:20]}[...]', skipping them.")
+    return alignment.entities
 
 
 def get_offsets_from_brat(annotation: Iterable[str], testing: bool = False):
@@ -209,6 +229,87 @@ def merge_two_annotations(first: List[List[str]], second: List[List[str]],
     return result
 
 
+def batch_by_budget(items: Iterable[Any], max_items: Optional[int] = None, max_tokens: Optional[int] = None,
+                    length: Callable[[Any], int] = len) -> Iterable[List[Any]]:
+    """
+    Groups a stream of items into batches.
+
+    A batch is closed when it holds `max_items` items or when adding the next item would push the summed `length`
+    of its items over `max_tokens`. An item longer than `max_tokens` forms a batch on its own.
+
+    Args:
+        items: Items to batch, e.g. docs or sentences.
+        max_items: Maximum number of items per batch.
+        max_tokens: Maximum summed length of the items per batch.
+        length: Length of a single item, defaults to `len`.
+
+    Returns:
+        Stream of batches, in input order.
+
+    """
+    if not max_items and not max_tokens:
+        raise ValueError("Need either max_items or max_tokens to batch!")
+    batch = []
+    tokens = 0
+    for item in items:
+        item_length = length(item) if max_tokens else 0
+        if batch and max_tokens and tokens + item_length > max_tokens:
+            yield batch
+            batch = []
+            tokens = 0
+        batch.append(item)
+        tokens += item_length
+        # hand out full batches right away instead of waiting for the next item
+        if max_items and len(batch) >= max_items:
+            yield batch
+            batch = []
+            tokens = 0
+    if batch:
+        yield batch
+
+
+def predict_bucketed(items: List[Any], predict: Callable[[List[Any]], List[Any]], max_tokens: int,
+                     length: Callable[[Any], int] = len) -> List[Any]:
+    """
+    Runs a batched prediction over items sorted and bucketed by length.
+
+    Items are sorted by their length and packed into batches whose padded size (number of items times the length of
+    the longest item) stays under `max_tokens`, so that similarly long items are padded together. An item longer than
+    `max_tokens` forms a batch on its own.
+
+    Args:
+        items: Inputs to the prediction, e.g. sentences or model instances.
+        predict: Callable returning one result per item of a batch, in order.
+        max_tokens: Maximum padded size of a batch.
+        length: Length of a single item, defaults to `len`.
+
+    Returns:
+        One result per item, in the order of `items`.
+
+    """
+    lengths = [length(item) for item in items]
+    order = sorted(range(len(items)), key=lengths.__getitem__)
+    results = [None] * len(items)
+    batch = []
+    for i in order:
+        # items come sorted, so the current one is the longest of the batch
+        if batch and lengths[i] * (len(batch) + 1) > max_tokens:
+            results = _scatter(results, batch, predict([items[j] for j in batch]))
+            batch = []
+        batch.append(i)
+    if batch:
+        results = _scatter(results, batch, predict([items[j] for j in batch]))
+    return results
+
+
+def _scatter(results: List[Any], indices: List[int], batch_results: List[Any]) -> List[Any]:
+    batch_results = list(batch_results)
+    assert len(indices) == len(batch_results)
+    for i, result in zip(indices, batch_results):
+        results[i] = result
+    return results
+
+
 def get_all_subclasses(cls):
     """
     Returns all (currently imported) subclasses of a given class.
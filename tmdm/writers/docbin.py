@@ -0,0 +1,181 @@
+import os
+import struct
+from uuid import UUID
+from typing import Collection, Iterator, Union, Any, List, Tuple, Optional, BinaryIO
+
+import srsly
+from loguru import logger
+from spacy.language import Language
+from spacy.tokens import Doc, DocBin
+from spacy.vocab import Vocab
+
+from tmdm.pipe.pipe import PipeElement
+from tmdm.util import serialisable_id
+
+# annotation layers of the data model, stored next to the spaCy docs
+LAYERS = ('nes', 'corefs', 'oies', 'relations')
+
+_LENGTH = struct.Struct('<Q')
+
+
+def _restored_id(doc_id: Any, is_uuid: bool) -> Any:
+    return UUID(doc_id) if is_uuid else doc_id
+
+
+def docs_to_bytes(docs: Collection[Doc]) -> bytes:
+    """
+    Serialises docs with their ids and annotation layers, without their vocab.
+
+    UUID ids (the default ids of a :class:`tmdm.pipe.pipe.Pipeline`) are restored as UUIDs, other ids that are
+    neither strings nor integers as their string.
+
+    Args:
+        docs: Docs to serialise.
+
+    Returns:
+        A msgpack-encoded spaCy :class:`DocBin` of the docs, next to their ids and annotation layers.
+
+    """
+    doc_bin = DocBin(store_user_data=False, docs=docs)
+    return srsly.msgpack_dumps({
+        'docs': doc_bin.to_bytes(),
+        'ids': [serialisable_id(doc._.id) for doc in docs],
+        'uuids': [isinstance(doc._.id, UUID) for doc in docs],
+        'layers': [{layer: getattr(doc._, f"_{layer}") for layer in LAYERS if getattr(doc._, f"_{layer}")}
+                   for doc in docs]
+    })
+
+
+def _decode(frame: dict, vocab: Vocab) -> Iterator[Doc]:
+    docs = DocBin(store_user_data=False).from_bytes(frame['docs']).get_docs(vocab)
+    for doc, doc_id, is_uuid, layers in zip(docs, frame['ids'], frame['uuids'], frame['layers']):
+        doc._.id = _restored_id(doc_id, is_uuid)
+        for layer, annotations in layers.items():
+            setattr(doc._, layer, annotations)
+        yield doc
+
+
+def docs_from_bytes(data: bytes, vocab: Union[Vocab, Language]) -> List[Doc]:
+    """
+    Restores docs serialised by :func:`docs_to_bytes`.
+
+    Args:
+        data: The serialised docs.
+        vocab: Vocab (or pipeline) to create the docs with.
+
+    Returns:
+        The docs with their ids and annotation layers.
+
+    """
+    vocab = vocab.vocab if isinstance(vocab, Language) else vocab
+    return list(_decode(srsly.msgpack_loads(data), vocab))
+
+
+class DocBinWriter:
+    """
+    Appends annotated docs to a file, one chunk per call.
+
+    Each chunk is written as two length-prefixed msgpack frames: a small header with the ids of the docs, followed by
+    a spaCy :class:`DocBin` of the docs and their ids and annotation layers. The header lets :func:`read_docbin_ids`
+    skip over the docs without decoding them. Frames are flushed right away, so that a crashed run leaves all complete
+    chunks readable by :func:`read_docbin`. Before appending to an existing file for the first time, a truncated chunk
+    at its end is cut off, so that new chunks follow the last complete one.
+
+    Args:
+        out_file: File to append to.
+    """
+
+    def __init__(self, out_file: str = "docs.tmdm"):
+        self.out_file = out_file
+        self._repaired = False
+
+    def _repair(self):
+        if os.path.exists(self.out_file):
+            end = complete_length(self.out_file)
+            if end < os.path.getsize(self.out_file):
+                logger.warning(f"Cutting off truncated chunk at the end of {self.out_file}.")
+                with open(self.out_file, 'r+b') as f:
+                    f.truncate(end)
+        self._repaired = True
+
+    def __call__(self, docs: Collection[Doc]) -> Collection[Doc]:
+        docs = list(docs)
+        ids = srsly.msgpack_dumps([serialisable_id(doc._.id) for doc in docs])
+        frame = docs_to_bytes(docs)
+        if not self._repaired:
+            self._repair()
+        with open(self.out_file, 'ab') as f:
+            f.write(_LENGTH.pack(len(ids)) + ids + _LENGTH.pack(len(frame)) + frame)
+        logger.debug(f"Wrote {len(docs)} docs to {self.out_file}.")
+        return docs
+
+
+def _read_frame(f: BinaryIO, size: int, skip: bool = False) -> Optional[bytes]:
+    header = f.read(_LENGTH.size)
+    if len(header) < _LENGTH.size:
+        return None
+    length = _LENGTH.unpack(header)[0]
+    if skip:
+        return b'' if f.seek(length, os.SEEK_CUR) <= size else None
+    frame = f.read(length)
+    return frame if len(frame) == length else None
+
+
+def _chunks(path: str, with_docs: bool = True) -> Iterator[Tuple[List[Any], Optional[bytes], int]]:
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while f.tell() < size:
+            ids = _read_frame(f, size)
+            frame = None if ids is None else _read_frame(f, size, skip=not with_docs)
+            if frame is None:
+                logger.warning(f"Skipping truncated chunk at the end of {path}.")
+                return
+            yield srsly.msgpack_loads(ids), frame if with_docs else None, f.tell()
+
+
+def complete_length(path: str) -> int:
+    """
+    Length of the complete chunks written by :class:`DocBinWriter`, i.e. without a truncated chunk at the end.
+    """
+    end = 0
+    for _, _, end in _chunks(path, with_docs=False):
+        pass
+    return end
+
+
+def read_docbin(path: str, vocab: Union[Vocab, Language]) -> Iterator[Doc]:
+    """
+    Lazily reads docs written by :class:`DocBinWriter`, one chunk at a time.
+
+    A truncated last chunk, e.g. from an interrupted run, is skipped.
+
+    Args:
+        path: File to read.
+        vocab: Vocab (or pipeline) to create the docs with.
+
+    Returns:
+        The docs with their ids and annotation layers, in the order they were written.
+
+    """
+    vocab = vocab.vocab if isinstance(vocab, Language) else vocab
+    for _, frame, _ in _chunks(path):
+        yield from _decode(srsly.msgpack_loads(frame), vocab)
+
+
+def read_docbin_ids(path: str) -> Iterator[Any]:
+    """
+    Reads the ids of the docs written by :class:`DocBinWriter` from the chunk headers, without decoding the docs.
+
+    Args:
+        path: File to read.
+
+    Returns:
+        The ids, in the order they were written.
+
+    """
+    for ids, _, _ in _chunks(path, with_docs=False):
+        yield from ids
+
+
+def get_docbin_writer_pipe(out_file: str = "docs.tmdm", chunk_size: int = 1000):
+    return PipeElement(name='docbin-writer', field=None, provider=DocBinWriter(out_file), batch_size=chunk_size)
@@ -8,7 +8,8 @@ def tsv_writer(docs, out_file="system.tsv", prefix=None):
 	with open(out_file, 'w') as tsv:
 		t_writer = csv.writer(tsv, delimiter='\t')
 		for i in range(len(docs)):
-			for ne in docs[i]._.nes:
+			# views don't create a span per entity
+			for ne in docs[i]._.ne_views:
 				tsvrow = []
 				# Document IDs are numbers 0 to number of docs
 				tsvrow.append(str(i))
@@ -17,7 +18,7 @@ def tsv_writer(docs, out_file="system.tsv", prefix=None):
 				tsvrow.append(ne.end_char)
 
 				# Prefix is meant for the EL ID, if none then has to be 'NIL' for neleval
-				kb_url = ne._.ne_meta.get('uri')
+				kb_url = ne.meta.get('uri')
 				if kb_url:
 					kb_id = kb_url.split('/')[-1]
 					if prefix: